@@ -0,0 +1,268 @@
+"""
+Long-running bench server that keeps instruments connected between runs.
+
+    python bench_server.py [--port 47800] [--reset connect|always|never]
+    python bench_server.py --status
+    python bench_server.py --stop
+
+Routines are sent to it with `python run_test.py <routine>.yaml --daemon`.
+"""
+import argparse
+import inspect
+import os
+import secrets
+import sys
+import time
+import traceback
+from multiprocessing.connection import Client, Listener
+
+from instruments.log import LOG_LEVELS, setup_logging
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+KEY_PATH = os.path.join(BASE_DIR, ".cache", "bench_server.key")
+
+DEFAULT_PORT = int(os.environ.get("TESTBENCH_DAEMON_PORT", "47800"))
+
+# When instruments are reset:
+#   connect - only when the server (re)connects them (the normal run_test behaviour)
+#   always  - before every routine
+#   never   - not even on connect; instruments keep their settings
+RESET_POLICIES = ("connect", "always", "never")
+
+
+# ----------------------------------------------------------------------
+# Local socket
+# ----------------------------------------------------------------------
+
+def load_authkey(create=False):
+    """
+    Shared secret for the local socket, readable only by this user.
+    """
+    if create and not os.path.isfile(KEY_PATH):
+        os.makedirs(os.path.dirname(KEY_PATH), exist_ok=True)
+        fd = os.open(KEY_PATH, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(secrets.token_hex(32))
+    with open(KEY_PATH) as f:
+        return f.read().strip().encode("ascii")
+
+
+def connect_client(port=DEFAULT_PORT):
+    """
+    Connect to a running bench server. Raises ConnectionRefusedError or
+    FileNotFoundError if none is running.
+    """
+    return Client(("127.0.0.1", port), authkey=load_authkey())
+
+
+class _ClientStream:
+    """
+    File-like object that forwards printed output to the client line by line.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.buffer = ""
+
+    def write(self, data):
+        self.buffer += data
+        if "\n" in self.buffer:
+            head, _, self.buffer = self.buffer.rpartition("\n")
+            self.conn.send(("out", head + "\n"))
+
+    def flush(self):
+        if self.buffer:
+            self.conn.send(("out", self.buffer))
+            self.buffer = ""
+
+
+# ----------------------------------------------------------------------
+# Server
+# ----------------------------------------------------------------------
+
+class BenchServer:
+    """
+    Holds connected drivers and runs compiled routines sent by clients,
+    one at a time.
+    """
+
+    def __init__(self, reset_policy="connect"):
+        if reset_policy not in RESET_POLICIES:
+            raise ValueError(f"Unsupported reset policy: {reset_policy}")
+        self.reset_policy = reset_policy
+        self.instruments = {}
+        # name -> (ip, transport) the connected driver was created with
+        self.signatures = {}
+        self.runs = 0
+
+    def _connect(self, name, info):
+        from run_test import create_instrument
+
+        inst = create_instrument(name, info)
+        if self.reset_policy == "never" and "reset" in inspect.signature(inst.connect).parameters:
+            idn = inst.connect(reset=False)
+        else:
+            idn = inst.connect()
+        print(f"[IDN] {name}: {idn}")
+        return inst
+
+    def ensure_instruments(self, cfg):
+        """
+        Connect the routine's instruments, reusing drivers that are already
+        connected to the same address, and apply the reset policy.
+        """
+        wanted = {
+            name: info
+            for name, info in (cfg.get("instruments") or {}).items()
+            if name != "local"
+        }
+
+        for name, info in wanted.items():
+            signature = (info["ip"], info.get("transport"))
+            inst = self.instruments.get(name)
+
+            if inst is not None and self.signatures[name] == signature:
+                if self.reset_policy == "always" and hasattr(inst, "reset"):
+                    print(f"[bench_server] resetting {name}")
+                    inst.reset()
+                continue
+
+            if inst is not None:
+                inst.close()
+            self.instruments[name] = self._connect(name, info)
+            self.signatures[name] = signature
+
+        return {name: self.instruments[name] for name in wanted}
+
+    def run_routine(self, cfg, plan, name=None, parquet=False):
+        from instruments.results_store import RunRecorder, save_run
+        from instruments.routine_runner import run_plan
+
+        t0 = time.perf_counter()
+        instruments = self.ensure_instruments(cfg)
+        setup = time.perf_counter() - t0
+
+        print("\n=== Starting test sequence ===")
+        recorder = RunRecorder(name, plan.key)
+        try:
+            run_plan(plan, instruments, recorder)
+        except Exception as e:
+            save_run(recorder.finish(e), parquet)
+            raise
+        paths = save_run(recorder.finish(), parquet)
+        print(f"[results] Run {recorder.run_id} saved to {', '.join(paths)}")
+        self.runs += 1
+        print(
+            f"\n[bench_server] setup {setup * 1000:.1f} ms, "
+            f"total {(time.perf_counter() - t0):.3f} s"
+        )
+
+    def status(self):
+        return {
+            "reset_policy": self.reset_policy,
+            "runs": self.runs,
+            "instruments": {
+                name: {"ip": ip, "transport": transport}
+                for name, (ip, transport) in self.signatures.items()
+            },
+        }
+
+    def handle(self, conn):
+        """
+        Serve one client request. Returns False when asked to shut down.
+        """
+        from run_test import Tee
+
+        msg = conn.recv()
+        cmd = msg.get("cmd")
+
+        if cmd == "run":
+            print(f"\n[bench_server] run {msg.get('name')}")
+            stream = _ClientStream(conn)
+            original_stdout = sys.stdout
+            sys.stdout = Tee(original_stdout, stream)
+            error = None
+            try:
+                self.run_routine(msg["cfg"], msg["plan"], msg.get("name"), msg.get("parquet", False))
+            except Exception:
+                error = traceback.format_exc()
+                print(error)
+            finally:
+                sys.stdout = original_stdout
+                stream.flush()
+            conn.send(("done", error))
+            return True
+
+        if cmd == "status":
+            conn.send(("status", self.status()))
+            return True
+
+        if cmd == "shutdown":
+            conn.send(("done", None))
+            return False
+
+        conn.send(("done", f"Unknown command: {cmd}"))
+        return True
+
+    def close(self):
+        for name, inst in self.instruments.items():
+            try:
+                inst.close()
+            except Exception as e:
+                print(f"[bench_server] closing {name} failed: {e}")
+        self.instruments = {}
+        self.signatures = {}
+
+    def serve(self, port=DEFAULT_PORT):
+        address = ("127.0.0.1", port)
+        with Listener(address, authkey=load_authkey(create=True)) as listener:
+            print(
+                f"[bench_server] listening on {address[0]}:{port} "
+                f"(reset policy: {self.reset_policy})"
+            )
+            keep_running = True
+            while keep_running:
+                try:
+                    with listener.accept() as conn:
+                        keep_running = self.handle(conn)
+                except (EOFError, OSError) as e:
+                    print(f"[bench_server] client disconnected: {e}")
+                except KeyboardInterrupt:
+                    break
+        self.close()
+        print("[bench_server] stopped")
+
+
+# ----------------------------------------------------------------------
+# CLI
+# ----------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--reset", choices=RESET_POLICIES, default="connect")
+    parser.add_argument("--log_level", choices=LOG_LEVELS, default="INFO")
+    parser.add_argument("--status", action="store_true", help="Show the running server's state")
+    parser.add_argument("--stop", action="store_true", help="Stop the running server")
+    args = parser.parse_args()
+
+    if args.status or args.stop:
+        try:
+            conn = connect_client(args.port)
+        except (ConnectionRefusedError, FileNotFoundError):
+            print("No bench server is running.")
+            sys.exit(1)
+        with conn:
+            conn.send({"cmd": "shutdown" if args.stop else "status"})
+            print(conn.recv()[1] or "Bench server stopped.")
+        return
+
+    from run_test import load_env_file
+
+    setup_logging(args.log_level)
+    load_env_file()
+    BenchServer(args.reset).serve(args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Measure SCPI round-trip latency to one instrument over each LAN transport.
+
+    python benchmark_transports.py <ip> [-n 200] [--query "*OPC?"]
+                                   [--transports vxi11 socket hislip asyncio]
+
+"asyncio" is the raw socket session used by run_test --async.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from instruments import visa_pool
+from instruments.async_scpi import AsyncSCPISocket
+from instruments.transports import TRANSPORTS, resource_options, resource_string
+
+
+def summarize(name, samples):
+    ms = sorted(s * 1000.0 for s in samples)
+    p95 = ms[min(len(ms) - 1, int(round(0.95 * (len(ms) - 1))))]
+    return {
+        "transport": name,
+        "n": len(ms),
+        "min_ms": ms[0],
+        "median_ms": statistics.median(ms),
+        "p95_ms": p95,
+        "mean_ms": statistics.fmean(ms),
+        "queries_per_s": len(ms) / (sum(ms) / 1000.0),
+    }
+
+
+def bench_visa(rm, ip, transport, query, n, timeout):
+    inst = rm.open_resource(resource_string(ip, transport), **resource_options(transport))
+    inst.timeout = timeout
+    try:
+        inst.query(query)  # warm-up
+        samples = []
+        for _ in range(n):
+            t0 = time.perf_counter()
+            inst.query(query)
+            samples.append(time.perf_counter() - t0)
+        return samples
+    finally:
+        inst.close()
+
+
+async def bench_asyncio(ip, query, n, timeout):
+    session = await AsyncSCPISocket.open(ip, timeout=timeout / 1000)
+    try:
+        await session.query(query)  # warm-up
+        samples = []
+        for _ in range(n):
+            t0 = time.perf_counter()
+            await session.query(query)
+            samples.append(time.perf_counter() - t0)
+        return samples
+    finally:
+        await session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("ip", help="Instrument IP address or hostname")
+    parser.add_argument("-n", type=int, default=200, help="Queries per transport")
+    parser.add_argument("--query", default="*OPC?", help="Query to time")
+    parser.add_argument("--timeout", type=int, default=5000, help="Timeout in ms")
+    parser.add_argument(
+        "--transports",
+        nargs="+",
+        default=list(TRANSPORTS) + ["asyncio"],
+        choices=list(TRANSPORTS) + ["asyncio"],
+    )
+    args = parser.parse_args()
+
+    rm = visa_pool.resource_manager()
+    rows = []
+
+    for transport in args.transports:
+        print(f"[benchmark] {transport}: {args.n} x {args.query}")
+        try:
+            if transport == "asyncio":
+                samples = asyncio.run(bench_asyncio(args.ip, args.query, args.n, args.timeout))
+            else:
+                samples = bench_visa(rm, args.ip, transport, args.query, args.n, args.timeout)
+        except Exception as e:
+            print(f"[benchmark] {transport}: failed ({e})")
+            continue
+        rows.append(summarize(transport, samples))
+
+    print()
+    print(f"{'transport':<10} {'n':>5} {'min ms':>8} {'median':>8} {'p95':>8} {'mean':>8} {'q/s':>8}")
+    for r in rows:
+        print(
+            f"{r['transport']:<10} {r['n']:>5} {r['min_ms']:>8.3f} {r['median_ms']:>8.3f} "
+            f"{r['p95_ms']:>8.3f} {r['mean_ms']:>8.3f} {r['queries_per_s']:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import asyncio
+import socket
+
+# Raw SCPI socket port used by Keysight, Rigol, Tektronix and Keithley.
+SCPI_SOCKET_PORT = 5025
+
+
+class AsyncSCPISocket:
+    """
+    Raw SCPI session over TCP, driven by an asyncio event loop.
+
+    Commands and responses are newline-terminated. Each session handles
+    one query at a time (SCPI does not allow a new query before the
+    previous response is read), but any number of sessions can have
+    queries outstanding on the same loop, with no thread per device.
+    """
+
+    def __init__(self, reader, writer, timeout=5.0, host=None, port=SCPI_SOCKET_PORT):
+        self.reader = reader
+        self.writer = writer
+        self.timeout = timeout
+        self.host = host
+        self.port = port
+        self.loop = asyncio.get_running_loop()
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    async def _connect(host, port, timeout):
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port), timeout
+        )
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            # Small SCPI messages should not wait for Nagle's algorithm.
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return reader, writer
+
+    @classmethod
+    async def open(cls, host, port=SCPI_SOCKET_PORT, timeout=5.0):
+        reader, writer = await cls._connect(host, port, timeout)
+        return cls(reader, writer, timeout, host, port)
+
+    async def _reconnect(self):
+        """
+        Replace the connection. Called with the lock held after a timeout,
+        since a late reply would otherwise be read as the answer to the
+        next query.
+        """
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except OSError:
+            pass
+        self.reader, self.writer = await self._connect(self.host, self.port, self.timeout)
+
+    async def write_raw(self, data):
+        async with self._lock:
+            self.writer.write(data)
+            await self.writer.drain()
+
+    async def write(self, cmd):
+        await self.write_raw(cmd.encode("ascii") + b"\n")
+
+    async def query(self, cmd):
+        async with self._lock:
+            self.writer.write(cmd.encode("ascii") + b"\n")
+            await self.writer.drain()
+            try:
+                line = await asyncio.wait_for(self.reader.readline(), self.timeout)
+            except asyncio.TimeoutError:
+                await self._reconnect()
+                raise TimeoutError(f"No reply to {cmd!r} within {self.timeout} s") from None
+
+        if not line:
+            raise ConnectionError(f"Connection closed while waiting for {cmd!r}")
+        return line.decode("ascii", errors="replace").rstrip("\r\n")
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except OSError:
+            pass
+
+    def run_sync(self, coro):
+        """
+        Run one of the coroutines above from synchronous code and wait for
+        the result. Works from worker threads while the session's loop is
+        running elsewhere, or directly when that loop is idle.
+        """
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+
+        if running is self.loop:
+            coro.close()
+            raise RuntimeError(
+                "Blocking instrument call on the event loop thread; "
+                "use the async method instead."
+            )
+
+        if self.loop.is_running():
+            return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+        if self.loop.is_closed():
+            coro.close()
+            raise RuntimeError("The event loop of this async session is closed.")
+
+        return self.loop.run_until_complete(coro)
@@ -0,0 +1,76 @@
+import hashlib
+import os
+import pickle
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.path.join(BASE_DIR, ".cache")
+
+# Pickled entries already loaded or stored by this process, keyed by
+# (kind, key). Kept as bytes so every load returns a fresh copy, and a
+# long-lived process (bench server, batch) never hands one run's cfg or
+# plan to the next after it has been modified.
+_memory = {}
+
+
+def content_key(*parts):
+    """
+    sha256 over the given str/bytes parts, usable as a cache key.
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        h.update(part)
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def file_key(path):
+    with open(path, "rb") as f:
+        return content_key(f.read())
+
+
+def _path(kind, key):
+    return os.path.join(CACHE_DIR, kind, f"{key}.pickle")
+
+
+def load(kind, key):
+    """
+    Return a copy of the cached object, or None. Unreadable entries count
+    as misses.
+    """
+    data = _memory.get((kind, key))
+    if data is None:
+        try:
+            with open(_path(kind, key), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+
+    try:
+        obj = pickle.loads(data)
+    except (pickle.PickleError, EOFError, AttributeError, ImportError):
+        return None
+
+    _memory[(kind, key)] = data
+    return obj
+
+
+def store(kind, key, obj):
+    data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    _memory[(kind, key)] = data
+
+    path = _path(kind, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write then rename so concurrent runs never see a partial file.
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except OSError:
+        # The cache is an optimisation only.
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
@@ -0,0 +1,183 @@
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from instruments.log import get_logger
+
+log = get_logger("frequency_response")
+
+
+def _frequency_points(frequencies=None, start=None, stop=None, points=None, spacing="log"):
+    if frequencies is not None:
+        freqs = np.asarray(frequencies, dtype=float).ravel()
+    else:
+        if start is None or stop is None or points is None:
+            raise ValueError(
+                "frequency_response requires 'frequencies' or 'start', 'stop' and 'points'"
+            )
+        if spacing == "log":
+            freqs = np.geomspace(float(start), float(stop), int(points))
+        elif spacing == "linear":
+            freqs = np.linspace(float(start), float(stop), int(points))
+        else:
+            raise ValueError(f"Unsupported frequency spacing: {spacing}")
+
+    if freqs.size == 0 or np.any(freqs <= 0):
+        raise ValueError("Frequencies must be positive")
+
+    return freqs
+
+
+def _timebase_scale(freq, cycles, divisions=10):
+    """Horizontal scale (s/div) that shows `cycles` periods on screen."""
+    return cycles / (freq * divisions)
+
+
+def compute_gain_phase(freqs, t, x, y):
+    """
+    Gain and phase of y relative to x at each stimulus frequency.
+
+    freqs has shape (P,); t, x and y have shape (P, N), one row per
+    frequency point. Each row is projected onto its own stimulus tone
+    (single-bin DFT with a Hann window), all rows at once.
+    """
+    window = np.hanning(x.shape[1])
+    x = (x - x.mean(axis=1, keepdims=True)) * window
+    y = (y - y.mean(axis=1, keepdims=True)) * window
+
+    ref = np.exp(-2j * np.pi * freqs[:, None] * t)
+    xc = np.einsum("ij,ij->i", x, ref)
+    yc = np.einsum("ij,ij->i", y, ref)
+
+    h = yc / xc
+    gain = np.abs(h)
+
+    with np.errstate(divide="ignore"):
+        gain_db = 20.0 * np.log10(gain)
+
+    phase_deg = np.degrees(np.angle(h))
+
+    return gain, gain_db, phase_deg
+
+
+def frequency_response(
+    scope,
+    wavegen,
+    input_channel,
+    output_channel,
+    amplitude,
+    wavegen_channel=1,
+    frequencies=None,
+    start=None,
+    stop=None,
+    points=None,
+    spacing="log",
+    offset=0.0,
+    cycles=5,
+    record_length=10000,
+    settle_time=0.0,
+    save_to=None,
+):
+    """
+    Measure gain and phase of output_channel relative to input_channel
+    over a set of sine frequencies, driving the Rigol and the Tek together.
+
+    The generator is retuned to the next frequency while the scope is
+    still transferring the current record, so instrument setup overlaps
+    data transfer. Gain and phase are computed in one vectorized pass at
+    the end.
+    """
+    freqs = _frequency_points(frequencies, start, stop, points, spacing)
+
+    scope.write("HOR:MODE MANUAL")
+    scope.write(f"HORIZONTAL:RECORDLENGTH {int(record_length)}")
+    scope.write("DATA:START 1")
+    scope.write(f"DATA:STOP {int(record_length)}")
+
+    def retune(freq):
+        wavegen.start_waveform(
+            channel=wavegen_channel,
+            waveform={
+                "type": "sine",
+                "frequency": float(freq),
+                "amplitude": amplitude,
+                "offset": offset,
+            },
+        )
+
+    retune(freqs[0])
+    scope.write(f"HOR:MAIN:SCALE {_timebase_scale(freqs[0], cycles)}")
+
+    times, inputs, outputs = [], [], []
+    t0 = time.perf_counter()
+
+    # One worker retunes the generator while the scope transfers a record.
+    # Its errors surface through future.result(), so a failed retune never
+    # leaves a point measured at the old frequency.
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="retune") as pool:
+        for i, freq in enumerate(freqs):
+            # Let the DUT settle for the configured time plus one period.
+            wait = settle_time + 1.0 / freq
+            if wait > 0:
+                time.sleep(wait)
+
+            scope.acquire_single()
+
+            future = None
+            if i + 1 < len(freqs):
+                # Run in a copy of this context so the worker's commands are
+                # attributed to the current step (see profiler).
+                context = contextvars.copy_context()
+                future = pool.submit(context.run, retune, freqs[i + 1])
+
+            t, x = scope.read_curve(input_channel)
+            _, y = scope.read_curve(output_channel)
+
+            if future is not None:
+                future.result()
+                scope.write(f"HOR:MAIN:SCALE {_timebase_scale(freqs[i + 1], cycles)}")
+
+            times.append(t)
+            inputs.append(x)
+            outputs.append(y)
+
+            log.info("[frequency_response] %d/%d: %.6g Hz", i + 1, len(freqs), freq)
+
+    elapsed = time.perf_counter() - t0
+
+    # Records can differ by a few samples between timebase settings.
+    n = min(len(row) for row in inputs + outputs)
+    t = np.stack([row[:n] for row in times])
+    x = np.stack([row[:n] for row in inputs])
+    y = np.stack([row[:n] for row in outputs])
+
+    gain, gain_db, phase_deg = compute_gain_phase(freqs, t, x, y)
+
+    points_per_s = len(freqs) / elapsed if elapsed > 0 else float("inf")
+    log.info(
+        "[frequency_response] %d points in %.2f s (%.2f points/s)",
+        len(freqs), elapsed, points_per_s,
+    )
+
+    if save_to:
+        table = np.column_stack([freqs, gain, gain_db, phase_deg])
+        np.savetxt(
+            save_to,
+            table,
+            delimiter=",",
+            header="frequency,gain,gain_db,phase_deg",
+            comments="",
+        )
+
+    return {
+        "frequency": freqs.tolist(),
+        "gain": gain.tolist(),
+        "gain_db": gain_db.tolist(),
+        "phase_deg": phase_deg.tolist(),
+        "points": int(len(freqs)),
+        "elapsed": elapsed,
+        "points_per_s": points_per_s,
+        "file": save_to,
+    }
@@ -1,30 +1,131 @@
-import pyvisa
+import asyncio
+
+from instruments import profiler, visa_pool
+from instruments.async_scpi import SCPI_SOCKET_PORT, AsyncSCPISocket
+from instruments.log import get_logger
+from instruments.transports import (
+    DEFAULT_TRANSPORT,
+    TRANSPORTS,
+    resource_options,
+    resource_string,
+)
+
+log = get_logger("instrument")
+
 
 class Instrument:
-    def __init__(self, ip_address, timeout=5000):
+    TRANSPORTS = TRANSPORTS
+
+    def __init__(self, ip_address, timeout=5000, transport=DEFAULT_TRANSPORT):
+        if transport not in self.TRANSPORTS:
+            raise ValueError(f"Unsupported transport: {transport}")
         self.ip = ip_address
-        self.rm = pyvisa.ResourceManager()
+        self.rm = visa_pool.resource_manager()
         self.timeout = timeout
+        self.transport = transport
         self.inst = None
+        # Raw-socket session opened by aconnect(); when set, the sync
+        # write/query below are routed through it.
+        self.session = None
 
     def connect(self):
-        resource = f"TCPIP::{self.ip}::INSTR"
-        print(resource)
-        self.inst = self.rm.open_resource(resource)
-        self.inst.timeout = self.timeout
+        self.resource = resource_string(self.ip, self.transport)
+        log.info("%s", self.resource)
+        self.inst = visa_pool.open_session(
+            self.resource, timeout=self.timeout, **resource_options(self.transport)
+        )
         return self.query("*IDN?")
 
+    @profiler.timed("write")
     def write(self, cmd):
+        if self.session is not None:
+            return self.session.run_sync(self.session.write(cmd))
         if self.inst is None:
             raise RuntimeError("Instrument not connected.")
         self.inst.write(cmd)
 
+    @profiler.timed("binary")
+    def write_binary_block(self, cmd, payload):
+        """
+        Send cmd followed by payload as an IEEE 488.2 definite-length block.
+        """
+        length = str(len(payload))
+        header = f"#{len(length)}{length}".encode("ascii")
+        data = cmd.encode("ascii") + header + payload + b"\n"
+        if self.session is not None:
+            return self.session.run_sync(self.session.write_raw(data))
+        if self.inst is None:
+            raise RuntimeError("Instrument not connected.")
+        self.inst.write_raw(data)
+
+    @profiler.timed("query")
     def query(self, cmd):
+        if self.session is not None:
+            return self.session.run_sync(self.session.query(cmd)).strip()
         if self.inst is None:
             raise RuntimeError("Instrument not connected.")
         return self.inst.query(cmd).strip()
 
+    def reset(self):
+        self.write("*RST")
+        self.write("*CLS")
+
     def close(self):
+        if self.session is not None:
+            self.session.run_sync(self.session.close())
+            self.session = None
+        if self.inst:
+            # The session stays in the pool for the next routine.
+            visa_pool.release(self.resource)
+            self.inst = None
+
+    # ------------------------------------------------------------------
+    # asyncio API
+    # ------------------------------------------------------------------
+
+    async def aconnect(self, port=SCPI_SOCKET_PORT, transport="socket"):
+        """
+        Open a raw SCPI socket session on the running event loop instead
+        of a VISA session. The sync API keeps working on top of it.
+
+        With a VISA transport (vxi11, hislip) the instrument is connected
+        with connect() in a worker thread instead; awrite/aquery then run
+        the sync calls in threads.
+        """
+        if transport != "socket":
+            if transport not in self.TRANSPORTS:
+                raise ValueError(f"Unsupported transport: {transport}")
+            self.transport = transport
+            return await asyncio.to_thread(self.connect)
+
+        log.info("TCPIP::%s::%s::SOCKET (asyncio)", self.ip, port)
+        self.session = await AsyncSCPISocket.open(
+            self.ip, port, timeout=self.timeout / 1000
+        )
+        return await self.aquery("*IDN?")
+
+    async def awrite(self, cmd):
+        if self.session is None:
+            return await asyncio.to_thread(self.write, cmd)
+        await self._session_write(cmd)
+
+    async def aquery(self, cmd):
+        if self.session is None:
+            return await asyncio.to_thread(self.query, cmd)
+        return await self._session_query(cmd)
+
+    # The sync fallbacks above are timed by write()/query() themselves.
+    @profiler.timed_async("write")
+    async def _session_write(self, cmd):
+        await self.session.write(cmd)
+
+    @profiler.timed_async("query")
+    async def _session_query(self, cmd):
+        return (await self.session.query(cmd)).strip()
+
+    async def aclose(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
         if self.inst:
-            self.inst.close()
-            self.inst = None
\ No newline at end of file
+            self.close()
\ No newline at end of file
@@ -1,14 +1,48 @@
-from instruments.keysight_es36312 import KeysightE36312
-from instruments.rigol_dg1062z import RigolDG1062Z
-from instruments.tektronix_mso58 import TekMSO58
-from instruments.keithley_2450 import Keithley2450
-from instruments.ni_vb8034 import NIVirtualBench
-
-INSTRUMENT_CLASSES = {
-    "keysight_e36312":    KeysightE36312,
-    "rigol_dg1062z":      RigolDG1062Z,
-    "tektronix_mso58":    TekMSO58,
-    "keithley_2450":      Keithley2450,  
-    "ni_virtualbench": NIVirtualBench,
+import importlib
+from collections.abc import Mapping
+
+# Instrument name -> "module:Class". Driver modules are imported the first
+# time their class is looked up, so a routine only loads the drivers (and
+# their dependencies: pymeasure, tm_devices, ...) that it actually uses.
+INSTRUMENT_PATHS = {
+    "keysight_e36312":    "instruments.keysight_es36312:KeysightE36312",
+    "rigol_dg1062z":      "instruments.rigol_dg1062z:RigolDG1062Z",
+    "tektronix_mso58":    "instruments.tektronix_mso58:TekMSO58",
+    "keithley_2450":      "instruments.keithley_2450:Keithley2450",
+    "ni_virtualbench":    "instruments.ni_vb8034:NIVirtualBench",
     "local": None
 }
+
+
+class LazyRegistry(Mapping):
+    """
+    Read-only mapping of instrument name -> driver class that imports each
+    driver module on first access. Listing or checking names imports nothing.
+    """
+
+    def __init__(self, paths):
+        self.paths = paths
+        self.classes = {}
+
+    def __getitem__(self, name):
+        path = self.paths[name]
+        if path is None:
+            return None
+        cls = self.classes.get(name)
+        if cls is None:
+            module_name, _, class_name = path.partition(":")
+            cls = getattr(importlib.import_module(module_name), class_name)
+            self.classes[name] = cls
+        return cls
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __contains__(self, name):
+        return name in self.paths
+
+
+INSTRUMENT_CLASSES = LazyRegistry(INSTRUMENT_PATHS)
@@ -4,25 +4,60 @@ from pymeasure.instruments.keithley import Keithley2450 as PMKeithley2450
 import os
 import csv
 
+from instruments import profiler, visa_pool
+from instruments.transports import (
+    DEFAULT_TRANSPORT,
+    TRANSPORTS,
+    resource_options,
+    resource_string,
+)
+
 class Keithley2450:
     """
     Keithley 2450 SMU driver implemented using PyMeasure.
     """
-    def __init__(self, ip_address, timeout=5000):
+    TRANSPORTS = TRANSPORTS
+
+    def __init__(self, ip_address, timeout=5000, transport=DEFAULT_TRANSPORT):
+        if transport not in self.TRANSPORTS:
+            raise ValueError(f"Unsupported transport: {transport}")
         self.ip = ip_address
         self.timeout = timeout
+        self.transport = transport
         self.inst = None
 
     # --------------------------------------------------
     # Connection
     # --------------------------------------------------
 
-    def connect(self):
-        resource = f"TCPIP::{self.ip}::INSTR"
-        self.inst = PMKeithley2450(resource)
+    def connect(self, reset=True):
+        """
+        Open (or reuse) the connection. reset=False keeps the SMU's
+        current settings, e.g. when a bench daemon reconnects.
+        """
+        resource = resource_string(self.ip, self.transport)
+        self._pool_key = ("pymeasure", resource)
+        # pymeasure opens its own VISA session; pooling the driver object
+        # lets later routines in this process reuse it.
+        self.inst = visa_pool.acquire(
+            self._pool_key,
+            lambda: PMKeithley2450(
+                resource,
+                visa_library=visa_pool.VISA_LIBRARY,
+                **resource_options(self.transport),
+            ),
+            check=lambda k: k.id,
+            close=lambda k: k.shutdown(),
+        )
+        # pymeasure properties and ask() go through write()/read().
+        profiler.wrap_methods(
+            self.inst, "Keithley2450",
+            {"write": "write", "read": "read", "write_bytes": "write", "read_bytes": "read"},
+        )
         self.inst.timeout = self.timeout
 
-        self.inst.reset()
+        if reset:
+            self.inst.reset()
         self.inst.disable_source()
 
         return {
@@ -33,16 +68,19 @@ class Keithley2450:
     def close(self):
         if self.inst:
             self.inst.disable_source()
-            self.inst.shutdown()
+            visa_pool.release(self._pool_key)
             self.inst = None
 
     # --------------------------------------------------
     # Actions
     # --------------------------------------------------
 
-    def smu_reset(self):
+    def reset(self):
         self.inst.reset()
         self.inst.disable_source()
+
+    def smu_reset(self):
+        self.reset()
         return {}
 
     def smu_zero_output(self):
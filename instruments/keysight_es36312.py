@@ -1,4 +1,5 @@
 from instruments.instrument_base import Instrument
+import asyncio
 import time
 
 class KeysightE36312(Instrument):
@@ -51,21 +52,34 @@ class KeysightE36312(Instrument):
     # Measurements
     # -------------
 
-    def measure_voltage(self, ch):
-        self._select(ch)
-        v = float(self.query("MEAS:VOLT?"))
+    # Measurements, set_power and ramp_voltage are written once as
+    # generators of ("write", cmd), ("query", cmd) and ("sleep", seconds)
+    # operations; _run and _arun execute them sync or on the event loop.
+
+    def _measure_voltage_ops(self, ch):
+        yield "write", f"INST:NSEL {ch}"
+        v = float((yield "query", "MEAS:VOLT?"))
         return {"channel": ch, "voltage": v}
 
-    def measure_current(self, ch):
-        self._select(ch)
-        i = float(self.query("MEAS:CURR?"))
+    def _measure_current_ops(self, ch):
+        yield "write", f"INST:NSEL {ch}"
+        i = float((yield "query", "MEAS:CURR?"))
         return {"channel": ch, "current": i}
+
+    def _measure_power_ops(self, ch):
+        yield "write", f"INST:NSEL {ch}"
+        v = float((yield "query", "MEAS:VOLT?"))
+        i = float((yield "query", "MEAS:CURR?"))
+        return {"channel": ch, "power": v * i}
+
+    def measure_voltage(self, ch):
+        return self._run(self._measure_voltage_ops(ch))
+
+    def measure_current(self, ch):
+        return self._run(self._measure_current_ops(ch))
     
     def measure_power(self, ch):
-        self._select(ch)
-        v = float(self.query("MEAS:VOLT?"))
-        i = float(self.query("MEAS:CURR?"))
-        return {"channel": ch, "power": v * i}
+        return self._run(self._measure_power_ops(ch))
 
     # -------------
     # Protections & sense
@@ -93,16 +107,13 @@ class KeysightE36312(Instrument):
     # High-level actions
     # -------------
 
-    def set_power(self, ch, voltage, current_limit, ramp_time=0.0, steps=20):
-        """
-        Convenience action: set voltage + current limit with optional ramp.
-        """
-
-        self.set_current_limit(ch, current_limit)
+    def _set_power_ops(self, ch, voltage, current_limit, ramp_time=0.0, steps=20):
+        yield "write", f"INST:NSEL {ch}"
+        yield "write", f"CURR {current_limit}"
 
         if ramp_time is None or ramp_time <= 0:
-            self.set_voltage(ch, voltage)
-            self.output_on(ch)
+            yield "write", f"VOLT {voltage}"
+            yield "write", "OUTP ON"
             return {
                 "channel": ch,
                 "voltage": voltage,
@@ -110,15 +121,8 @@ class KeysightE36312(Instrument):
                 "ramped": False,
             }
 
-        self.output_on(ch)
-        dv = voltage / steps
-        dt = ramp_time / steps
-
-        for i in range(1, steps + 1):
-            self.set_voltage(ch, dv * i)
-            time.sleep(dt)
-
-        self.set_voltage(ch, voltage)
+        yield "write", "OUTP ON"
+        yield from self._ramp_ops(voltage, ramp_time, steps)
 
         return {
             "channel": ch,
@@ -128,26 +132,52 @@ class KeysightE36312(Instrument):
             "ramp_time": ramp_time,
         }
 
+    def _ramp_voltage_ops(self, ch, target_voltage, ramp_time, steps=20):
+        yield "write", f"INST:NSEL {ch}"
+        yield "write", "OUTP ON"
+        yield from self._ramp_ops(target_voltage, ramp_time, steps)
 
-    def ramp_voltage(self, ch, target_voltage, ramp_time, steps=20):
-        self._select(ch)
+        return {
+            "channel": ch,
+            "final_voltage": target_voltage,
+            "ramp_time": ramp_time,
+        }
 
+    @staticmethod
+    def _ramp_ops(target_voltage, ramp_time, steps):
+        # Channel already selected.
         dv = target_voltage / steps
         dt = ramp_time / steps
 
-        self.output_on(ch)
-
         for i in range(1, steps + 1):
-            self.set_voltage(ch, dv * i)
-            time.sleep(dt)
+            yield "write", f"VOLT {dv * i}"
+            yield "sleep", dt
 
-        self.set_voltage(ch, target_voltage)
+        yield "write", f"VOLT {target_voltage}"
 
-        return {
-            "channel": ch,
-            "final_voltage": target_voltage,
-            "ramp_time": ramp_time,
-        }
+    def set_power(self, ch, voltage, current_limit, ramp_time=0.0, steps=20):
+        """
+        Convenience action: set voltage + current limit with optional ramp.
+        """
+        return self._run(self._set_power_ops(ch, voltage, current_limit, ramp_time, steps))
+
+    def ramp_voltage(self, ch, target_voltage, ramp_time, steps=20):
+        return self._run(self._ramp_voltage_ops(ch, target_voltage, ramp_time, steps))
+
+    def _run(self, ops):
+        reply = None
+        while True:
+            try:
+                op, arg = ops.send(reply)
+            except StopIteration as done:
+                return done.value
+            reply = None
+            if op == "write":
+                self.write(arg)
+            elif op == "query":
+                reply = self.query(arg)
+            else:
+                time.sleep(arg)
 
 
     def configure_psu(
@@ -181,3 +211,38 @@ class KeysightE36312(Instrument):
             "output_enabled": output_enabled,
             "sense_mode": sense_mode,
         }
+
+
+    # -------------
+    # asyncio variants (used by the async runner when available)
+    # -------------
+
+    async def _arun(self, ops):
+        reply = None
+        while True:
+            try:
+                op, arg = ops.send(reply)
+            except StopIteration as done:
+                return done.value
+            reply = None
+            if op == "write":
+                await self.awrite(arg)
+            elif op == "query":
+                reply = await self.aquery(arg)
+            else:
+                await asyncio.sleep(arg)
+
+    async def measure_voltage_async(self, ch):
+        return await self._arun(self._measure_voltage_ops(ch))
+
+    async def measure_current_async(self, ch):
+        return await self._arun(self._measure_current_ops(ch))
+
+    async def measure_power_async(self, ch):
+        return await self._arun(self._measure_power_ops(ch))
+
+    async def set_power_async(self, ch, voltage, current_limit, ramp_time=0.0, steps=20):
+        return await self._arun(self._set_power_ops(ch, voltage, current_limit, ramp_time, steps))
+
+    async def ramp_voltage_async(self, ch, target_voltage, ramp_time, steps=20):
+        return await self._arun(self._ramp_voltage_ops(ch, target_voltage, ramp_time, steps))
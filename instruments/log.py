@@ -0,0 +1,167 @@
+import logging
+import queue
+import reprlib
+import sys
+import threading
+
+LOGGER_NAME = "testbench"
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+
+# Third-party loggers that echo every command at INFO/DEBUG.
+QUIET_LOGGERS = ("tm_devices", "pyvisa", "pymeasure")
+
+
+def get_logger(name):
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+
+# ----------------------------------------------------------------------
+# Payload truncation
+# ----------------------------------------------------------------------
+
+class _ShortRepr(reprlib.Repr):
+    def __init__(self):
+        super().__init__()
+        self.maxlevel = 3
+        self.maxdict = 8
+        self.maxlist = 8
+        self.maxtuple = 8
+        self.maxstring = 120
+        self.maxother = 120
+
+    def repr_ndarray(self, x, level):
+        if x.size <= self.maxlist:
+            return repr(x.tolist())
+        head = ", ".join(f"{v:.6g}" if isinstance(v, float) else repr(v) for v in x.flat[:4].tolist())
+        return f"array([{head}, ...], shape={x.shape}, dtype={x.dtype})"
+
+
+_short_repr = _ShortRepr()
+
+
+class Short:
+    """
+    Log argument that formats as a truncated repr, and only when the
+    record is actually emitted:
+
+        log.debug("last_result=%s", Short(last_result))
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return _short_repr.repr(self.value)
+
+    __repr__ = __str__
+
+
+# ----------------------------------------------------------------------
+# Handlers
+# ----------------------------------------------------------------------
+
+class _ConsoleHandler(logging.StreamHandler):
+    """
+    Writes to whatever sys.stdout is at emit time, so records follow the
+    same redirections as print() (--save_log, bench server clients,
+    bench workers).
+    """
+
+    def __init__(self):
+        super().__init__(sys.stdout)
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class _Formatter(logging.Formatter):
+    # INFO records look exactly like the plain console output.
+    def format(self, record):
+        message = super().format(record)
+        if record.levelno == logging.INFO:
+            return message
+        return f"[{record.levelname}] {message}"
+
+
+class AsyncFileWriter:
+    """
+    File-like log sink: write() only queues the text, and a background
+    thread appends it to the file in batches. close() drains the queue.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "w", buffering=64 * 1024)
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self._drain, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def _drain(self):
+        while True:
+            data = self.queue.get()
+            if data is None:
+                break
+            chunks = [data]
+            # Batch whatever else is already waiting.
+            while True:
+                try:
+                    data = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if data is None:
+                    self.file.write("".join(chunks))
+                    self.file.flush()
+                    return
+                chunks.append(data)
+            self.file.write("".join(chunks))
+        self.file.flush()
+
+    def write(self, data):
+        self.queue.put(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.file.close()
+
+
+def _install_console_handler(root):
+    if not any(isinstance(h, _ConsoleHandler) for h in root.handlers):
+        handler = _ConsoleHandler()
+        handler.setFormatter(_Formatter("%(message)s"))
+        root.addHandler(handler)
+        root.propagate = False
+
+
+def setup_logging(level="INFO"):
+    """
+    Configure the testbench loggers once per process. Calling it again
+    only changes the level.
+    """
+    root = logging.getLogger(LOGGER_NAME)
+    root.setLevel(level)
+    _install_console_handler(root)
+
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    return root
+
+
+# run_test() and the drivers used as a library, without setup_logging(),
+# still print their INFO lines to the console like the CLI does.
+_default_root = logging.getLogger(LOGGER_NAME)
+if _default_root.level == logging.NOTSET:
+    _default_root.setLevel(logging.INFO)
+_install_console_handler(_default_root)
+
@@ -1,17 +1,59 @@
+import time
+
+import numpy as np
 from pymeasure.instruments.ni import VirtualBench
 
+from instruments.waveform_io import save_waveforms
+
+# Sleep until this long before a pattern deadline, then busy-wait.
+DIO_SPIN_MARGIN = 0.002
+
+DIO_WAIT_CONDITIONS = ("high", "low", "rising", "falling", "change")
+
+DMM_FUNCTIONS = {
+    "dc_volts": "DC_VOLTS",
+    "ac_volts": "AC_VOLTS",
+    "dc_current": "DC_CURRENT",
+    "ac_current": "AC_CURRENT",
+    "resistance": "RESISTANCE",
+    "diode": "DIODE",
+}
+
+def _parse_mso_channels(channels):
+    """
+    Channel numbers in an MSO channel string, in order:
+    'VB8034-01/mso/1:2,4' -> [1, 2, 4].
+    """
+    numbers = []
+    for part in str(channels).split(","):
+        part = part.strip().rsplit("/", 1)[-1]
+        if not part:
+            continue
+        if ":" in part:
+            first, last = (int(p) for p in part.split(":"))
+            numbers.extend(range(first, last + 1))
+        else:
+            numbers.append(int(part))
+    return numbers
+
+
 class NIVirtualBench:
     """
     NI VirtualBench wrapper using PyMeasure.
 
     Supported subsystems:
       - Power Supply (PSU)
-      - Digital IO (DIO)
+      - Digital IO (DIO), including timed pattern playback
+      - Mixed-signal oscilloscope (analog capture)
+      - Digital multimeter (DMM)
     """
 
     def __init__(self, resource):
         self.resource = resource
         self.vb = None
+        self._line_strings = {}
+        self._mso = None
+        self._dmm = None
 
     # ============================================================
     # Session / common
@@ -25,6 +67,8 @@ class NIVirtualBench:
         if self.vb:
             self.vb.shutdown()
             self.vb = None
+        self._mso = None
+        self._dmm = None
 
     def vb_identify(self):
         return {
@@ -86,7 +130,10 @@ class NIVirtualBench:
     def _format_dio_lines(self, lines):
         """
         Convert list of DIO line indices into NI channel string.
-        Example: [0,1,2,3] -> 'dig/0:3'
+        Example: [0,1,2,3] -> 'dig/0:3', [2,0] -> 'dig/2,0'
+
+        The caller's order is kept, since values and pattern columns are
+        given in that order.
         """
         if isinstance(lines, str):
             return lines
@@ -94,16 +141,24 @@ class NIVirtualBench:
         if not isinstance(lines, (list, tuple)):
             raise ValueError("DIO lines must be list, tuple, or string")
 
+        key = tuple(lines)
+        cached = self._line_strings.get(key)
+        if cached is not None:
+            return cached
+
         if not lines:
             raise ValueError("DIO lines list cannot be empty")
 
-        lines = sorted(lines)
+        lines = list(lines)
 
         if lines == list(range(lines[0], lines[-1] + 1)):
-            return f"dig/{lines[0]}:{lines[-1]}"
+            line_str = f"dig/{lines[0]}:{lines[-1]}"
         else:
             joined = ",".join(str(i) for i in lines)
-            return f"dig/{joined}"
+            line_str = f"dig/{joined}"
+
+        self._line_strings[key] = line_str
+        return line_str
 
     def vb_dio_configure(self, lines, direction):
         line_str = self._format_dio_lines(lines)
@@ -146,3 +201,280 @@ class NIVirtualBench:
             "values": list(values),
         }
 
+    def vb_dio_pattern(self, lines, patterns, period, repeat=1):
+        """
+        Play a sequence of DIO patterns, one every `period` seconds.
+
+        patterns is a list of value lists or a NumPy boolean matrix with
+        one row per step and one column per line. The VirtualBench DIO is
+        static (no hardware pattern clock), so steps are host-timed
+        against absolute deadlines; rows equal to the previous one are
+        not re-sent.
+        """
+        if int(repeat) < 1:
+            raise ValueError("DIO pattern repeat must be at least 1")
+
+        if period <= 0:
+            raise ValueError("DIO pattern period must be positive")
+
+        line_str = self._format_dio_lines(lines)
+
+        matrix = np.asarray(patterns)
+        if matrix.size == 0:
+            raise ValueError("DIO pattern list cannot be empty")
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1)
+
+        if matrix.ndim != 2 or matrix.shape[1] != len(lines):
+            raise ValueError(
+                f"DIO pattern shape {matrix.shape} does not match {len(lines)} lines"
+            )
+
+        rows = matrix.astype(bool).tolist()
+        steps = len(rows) * int(repeat)
+
+        write = self.vb.dio.write
+        lateness = np.empty(steps)
+        previous = None
+
+        start = time.perf_counter()
+        for k in range(steps):
+            row = rows[k % len(rows)]
+            deadline = start + k * period
+
+            remaining = deadline - time.perf_counter()
+            if remaining > DIO_SPIN_MARGIN:
+                time.sleep(remaining - DIO_SPIN_MARGIN)
+            while time.perf_counter() < deadline:
+                pass
+
+            if row != previous:
+                write(line_str, row)
+                previous = row
+
+            lateness[k] = time.perf_counter() - deadline
+
+        duration = time.perf_counter() - start
+
+        return {
+            "lines": lines,
+            "steps": steps,
+            "period": period,
+            "repeat": int(repeat),
+            "duration": duration,
+            "jitter_mean": float(lateness.mean()),
+            "jitter_max": float(lateness.max()),
+            "late_steps": int(np.count_nonzero(lateness > period)),
+        }
+
+    def vb_dio_wait(
+        self,
+        lines,
+        condition="high",
+        match="any",
+        timeout=10.0,
+        poll_interval=0.0,
+        raise_on_timeout=True,
+    ):
+        """
+        Poll DIO lines until a level or edge condition is met.
+
+        With poll_interval 0 the lines are read back-to-back, so the
+        detection resolution is one DIO read.
+        """
+        if condition not in DIO_WAIT_CONDITIONS:
+            raise ValueError(f"Unsupported DIO wait condition: {condition}")
+
+        if match not in ("any", "all"):
+            raise ValueError(f"Unsupported DIO wait match: {match}")
+
+        line_str = self._format_dio_lines(lines)
+        read = self.vb.dio.read
+        combine = any if match == "any" else all
+
+        if condition == "high":
+            test = lambda prev, cur: combine(cur)
+        elif condition == "low":
+            test = lambda prev, cur: combine(not v for v in cur)
+        elif condition == "rising":
+            test = lambda prev, cur: combine(c and not p for p, c in zip(prev, cur))
+        elif condition == "falling":
+            test = lambda prev, cur: combine(p and not c for p, c in zip(prev, cur))
+        else:
+            test = lambda prev, cur: combine(p != c for p, c in zip(prev, cur))
+
+        start = time.perf_counter()
+        deadline = start + timeout
+        previous = [bool(v) for v in read(line_str)]
+        polls = 1
+
+        detected = condition in ("high", "low") and test(previous, previous)
+        current = previous
+        now = time.perf_counter()
+
+        while not detected and now < deadline:
+            if poll_interval > 0:
+                time.sleep(poll_interval)
+            current = [bool(v) for v in read(line_str)]
+            now = time.perf_counter()
+            polls += 1
+            detected = test(previous, current)
+            previous = current
+
+        if not detected and raise_on_timeout:
+            raise TimeoutError(
+                f"DIO lines {lines} did not go {condition} within {timeout} s"
+            )
+
+        latency = now - start
+
+        return {
+            "lines": lines,
+            "condition": condition,
+            "detected": detected,
+            "values": current,
+            "timestamp": time.time() - (time.perf_counter() - now),
+            "latency": latency,
+            "polls": polls,
+            "poll_period": latency / polls,
+        }
+
+    # ============================================================
+    # Mixed-signal oscilloscope
+    # ============================================================
+    def _scope(self):
+        if self._mso is None:
+            self.vb.acquire_mixed_signal_oscilloscope()
+            self._mso = self.vb.mso
+        return self._mso
+
+    def vb_scope_capture(
+        self,
+        channels,
+        duration,
+        sample_rate=None,
+        vertical_range=10.0,
+        vertical_offset=0.0,
+        coupling="dc",
+        probe_attenuation=1,
+        trigger=None,
+        pretrigger_time=0.0,
+        save_to=None,
+    ):
+        """
+        Capture analog channels and return them as NumPy arrays.
+
+        Result keys and file formats follow TekMSO58.capture (.csv or
+        binary .npz via waveform_io), so captures from either scope can be
+        processed the same way.
+        """
+        mso = self._scope()
+
+        for ch in channels:
+            mso.configure_analog_channel(
+                f"mso/{ch}",
+                True,
+                vertical_range,
+                vertical_offset,
+                probe_attenuation,
+                coupling.upper(),
+            )
+
+        if sample_rate is None:
+            # Keep the rate the device is currently configured for.
+            sample_rate = mso.query_timing()[0]
+
+        mso.configure_timing(sample_rate, duration, pretrigger_time, "SAMPLE")
+
+        if trigger:
+            mso.configure_analog_edge_trigger(
+                f"mso/{trigger.get('source', channels[0])}",
+                trigger.get("slope", "rising").upper(),
+                trigger.get("level", 0.0),
+                trigger.get("hysteresis", 0.0),
+                "A",
+            )
+        else:
+            mso.configure_immediate_trigger()
+
+        mso.run()
+        analog, stride = mso.read_analog_digital_u64()[:2]
+        actual_rate = mso.query_timing()[0]
+
+        # Samples are interleaved over every enabled channel, which may
+        # include channels left on by an earlier capture.
+        enabled = _parse_mso_channels(mso.query_enabled_analog_channels())
+        if len(enabled) != stride:
+            raise RuntimeError(
+                f"MSO returned {stride} channel(s) per sample but reports {enabled} enabled"
+            )
+
+        samples = np.asarray(analog, dtype=float).reshape(-1, stride)
+        t = np.arange(samples.shape[0]) / actual_rate
+        data = {f"{ch}": samples[:, enabled.index(int(ch))] for ch in channels}
+
+        result = {
+            "channels": channels,
+            "duration": duration,
+            "file": save_to,
+            "num_channels": len(channels),
+            "samples_per_channel": {
+                ch: len(data[f"{ch}"]) for ch in channels
+            },
+            "sample_rate": actual_rate,
+            "measurements": {},
+        }
+
+        if save_to is not None:
+            save_waveforms(save_to, t, data, metadata=result)
+
+        result["data"] = {"t": t, **data}
+        return result
+
+    # ============================================================
+    # Digital multimeter
+    # ============================================================
+    def _multimeter(self):
+        if self._dmm is None:
+            self.vb.acquire_digital_multimeter()
+            self._dmm = self.vb.dmm
+        return self._dmm
+
+    def vb_dmm_read(self, function="dc_volts", manual_range=None, samples=1, interval=0.0, save_to=None):
+        """
+        Take one or more DMM readings and return them as a NumPy array.
+        """
+        key = function.lower()
+        if key not in DMM_FUNCTIONS:
+            raise ValueError(f"Unsupported DMM function: {function}")
+
+        if int(samples) < 1:
+            raise ValueError("DMM samples must be at least 1")
+
+        dmm = self._multimeter()
+        if manual_range is None:
+            dmm.configure_measurement(DMM_FUNCTIONS[key], True)
+        else:
+            dmm.configure_measurement(DMM_FUNCTIONS[key], False, manual_range)
+
+        values = np.empty(int(samples))
+        stamps = np.empty(int(samples))
+        start = time.perf_counter()
+        for i in range(int(samples)):
+            if i and interval > 0:
+                time.sleep(interval)
+            values[i] = dmm.read()
+            stamps[i] = time.perf_counter() - start
+
+        result = {
+            "function": key,
+            "value": float(values.mean()),
+            "samples": int(samples),
+            "file": save_to,
+        }
+
+        if save_to is not None:
+            save_waveforms(save_to, stamps, {key: values}, metadata=result)
+
+        result["data"] = {"t": stamps, key: values}
+        return result
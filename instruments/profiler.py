@@ -0,0 +1,317 @@
+import contextvars
+import functools
+import threading
+import time
+from collections import defaultdict
+
+# The active Profiler, or None. Hooks check this first, so they cost one
+# global lookup when profiling is off.
+ACTIVE = None
+
+# Histogram bucket upper bounds in seconds; the last bucket is open.
+HISTOGRAM_BOUNDS = (1e-4, 1e-3, 1e-2, 1e-1, 1.0, 10.0)
+HISTOGRAM_LABELS = ("<0.1ms", "<1ms", "<10ms", "<100ms", "<1s", "<10s", ">=10s")
+
+TOP_N = 20
+
+# Step the current thread / task is running, so commands can be
+# attributed to it.
+_current_step = contextvars.ContextVar("current_step", default=None)
+
+
+class _StepTiming:
+    __slots__ = ("action", "instrument", "start", "duration", "sleep", "io")
+
+    def __init__(self, action, instrument):
+        self.action = action
+        self.instrument = instrument
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.sleep = 0.0
+        self.io = 0.0
+
+
+class _Command:
+    __slots__ = ("instrument", "kind", "command", "duration", "bytes_out", "bytes_in", "action")
+
+    def __init__(self, instrument, kind, command, duration, bytes_out, bytes_in, action):
+        self.instrument = instrument
+        self.kind = kind
+        self.command = command
+        self.duration = duration
+        self.bytes_out = bytes_out
+        self.bytes_in = bytes_in
+        self.action = action
+
+
+def _size(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode("utf-8", errors="replace"))
+    return 0
+
+
+def _header(command):
+    """
+    Group key for a command: "VOLT 3.3,(@1)" -> "VOLT".
+    """
+    return command.split(None, 1)[0] if command else command
+
+
+class Profiler:
+    """
+    Collects step timings (with their sleeps) and every instrument
+    command with its duration and bytes transferred.
+    """
+
+    def __init__(self):
+        self.steps = []
+        self.commands = []
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Hooks
+    # ------------------------------------------------------------------
+
+    def begin_step(self, action, instrument):
+        timing = _StepTiming(action, instrument)
+        return timing, _current_step.set(timing)
+
+    def end_step(self, token):
+        timing, var_token = token
+        timing.duration = time.perf_counter() - timing.start
+        _current_step.reset(var_token)
+        with self._lock:
+            self.steps.append(timing)
+
+    def command(self, instrument, kind, command, duration, bytes_out=0, bytes_in=0):
+        step = _current_step.get()
+        if step is not None:
+            step.io += duration
+        record = _Command(
+            instrument, kind, command, duration, bytes_out, bytes_in,
+            step.action if step is not None else None,
+        )
+        with self._lock:
+            self.commands.append(record)
+
+    # ------------------------------------------------------------------
+    # Report
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _histogram(durations):
+        counts = [0] * len(HISTOGRAM_LABELS)
+        for d in durations:
+            for i, bound in enumerate(HISTOGRAM_BOUNDS):
+                if d < bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+        return counts
+
+    @staticmethod
+    def _stats(durations):
+        ordered = sorted(durations)
+        n = len(ordered)
+        return {
+            "n": n,
+            "total": sum(ordered),
+            "mean": sum(ordered) / n,
+            "p50": ordered[n // 2],
+            "p95": ordered[min(n - 1, int(0.95 * n))],
+            "max": ordered[-1],
+        }
+
+    def _histogram_lines(self, groups):
+        lines = [f"{'':<32} " + " ".join(f"{label:>7}" for label in HISTOGRAM_LABELS)]
+        for name, durations in sorted(groups.items(), key=lambda kv: -sum(kv[1])):
+            counts = self._histogram(durations)
+            lines.append(f"{name[:32]:<32} " + " ".join(f"{c:>7}" for c in counts))
+        return lines
+
+    def report(self, top_n=TOP_N):
+        """
+        Text report: per-action breakdown into sleep / instrument I/O /
+        Python, latency histograms per action and per command, and the
+        top_n slowest commands.
+        """
+        wall = time.perf_counter() - self.started
+        lines = [f"Profile: {len(self.steps)} step(s), {len(self.commands)} command(s), {wall:.3f} s wall time", ""]
+
+        by_action = defaultdict(list)
+        for s in self.steps:
+            by_action[s.action].append(s)
+
+        lines.append("== Steps per action (seconds) ==")
+        lines.append(
+            f"{'action':<32} {'n':>6} {'total':>9} {'mean':>9} {'p95':>9} {'max':>9} "
+            f"{'sleep':>9} {'io':>9} {'python':>9}"
+        )
+        for action, steps in sorted(by_action.items(), key=lambda kv: -sum(s.duration for s in kv[1])):
+            st = self._stats([s.duration for s in steps])
+            sleep = sum(s.sleep for s in steps)
+            io = sum(s.io for s in steps)
+            python = max(0.0, st["total"] - sleep - io)
+            lines.append(
+                f"{action[:32]:<32} {st['n']:>6} {st['total']:>9.4f} {st['mean']:>9.4f} {st['p95']:>9.4f} "
+                f"{st['max']:>9.4f} {sleep:>9.4f} {io:>9.4f} {python:>9.4f}"
+            )
+
+        lines += ["", "== Step latency histogram per action =="]
+        lines += self._histogram_lines({a: [s.duration for s in steps] for a, steps in by_action.items()})
+
+        by_command = defaultdict(list)
+        for c in self.commands:
+            by_command[f"{c.instrument}: {_header(c.command)}"].append(c)
+
+        lines += ["", "== Commands (seconds, bytes) =="]
+        lines.append(
+            f"{'command':<40} {'n':>6} {'total':>9} {'mean':>9} {'p95':>9} {'max':>9} {'out':>10} {'in':>10}"
+        )
+        for name, cmds in sorted(by_command.items(), key=lambda kv: -sum(c.duration for c in kv[1])):
+            st = self._stats([c.duration for c in cmds])
+            lines.append(
+                f"{name[:40]:<40} {st['n']:>6} {st['total']:>9.4f} {st['mean']:>9.5f} {st['p95']:>9.5f} "
+                f"{st['max']:>9.5f} {sum(c.bytes_out for c in cmds):>10} {sum(c.bytes_in for c in cmds):>10}"
+            )
+
+        lines += ["", "== Command latency histogram =="]
+        lines += self._histogram_lines({k: [c.duration for c in v] for k, v in by_command.items()})
+
+        lines += ["", f"== Top {top_n} slowest commands =="]
+        for c in sorted(self.commands, key=lambda c: -c.duration)[:top_n]:
+            lines.append(
+                f"{c.duration * 1000:>10.3f} ms  {c.instrument:<16} {c.kind:<6} "
+                f"{c.command[:60]!r}  out={c.bytes_out} in={c.bytes_in}  step={c.action}"
+            )
+
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, path, top_n=TOP_N):
+        with open(path, "w") as f:
+            f.write(self.report(top_n))
+        return path
+
+
+def enable():
+    global ACTIVE
+    ACTIVE = Profiler()
+    return ACTIVE
+
+
+def disable():
+    global ACTIVE
+    profiler, ACTIVE = ACTIVE, None
+    return profiler
+
+
+def add_sleep(token, seconds):
+    """
+    Count a step delay (delay_before / delay_after) as sleep for the step
+    begin_step returned token for; token may be None.
+    """
+    if token is not None:
+        token[0].sleep += seconds
+
+
+# ----------------------------------------------------------------------
+# Timing wrappers
+# ----------------------------------------------------------------------
+
+def _record(profiler, instrument, kind, args, result, duration):
+    """
+    kind: "write" / "query" (args[0] is the command), "binary" (args are
+    command and payload) or "read".
+    """
+    sent = args[0] if args and kind in ("write", "query", "binary") else None
+    if isinstance(sent, str):
+        command = sent
+    else:
+        command = f"<{_size(sent)} bytes>" if sent is not None else ""
+
+    bytes_out = _size(sent) + 1 if sent is not None else 0
+    if kind == "binary" and len(args) > 1:
+        bytes_out += _size(args[1])
+
+    profiler.command(
+        instrument, kind, command, duration,
+        bytes_out=bytes_out,
+        bytes_in=_size(result) if kind in ("query", "read") else 0,
+    )
+
+
+def timed(kind):
+    """
+    Decorator for driver methods that talk to the instrument. The
+    instrument is named after the driver class.
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            profiler = ACTIVE
+            if profiler is None:
+                return method(self, *args, **kwargs)
+            t0 = time.perf_counter()
+            result = method(self, *args, **kwargs)
+            _record(profiler, type(self).__name__, kind, args, result, time.perf_counter() - t0)
+            return result
+
+        return wrapper
+    return decorate
+
+
+def timed_async(kind):
+    """
+    timed() for coroutine methods.
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            profiler = ACTIVE
+            if profiler is None:
+                return await method(self, *args, **kwargs)
+            t0 = time.perf_counter()
+            result = await method(self, *args, **kwargs)
+            _record(profiler, type(self).__name__, kind, args, result, time.perf_counter() - t0)
+            return result
+
+        return wrapper
+    return decorate
+
+
+def _timed_bound(instrument, kind, method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        profiler = ACTIVE
+        if profiler is None:
+            return method(*args, **kwargs)
+        t0 = time.perf_counter()
+        result = method(*args, **kwargs)
+        _record(profiler, instrument, kind, args, result, time.perf_counter() - t0)
+        return result
+
+    wrapper.__profiled__ = True
+    return wrapper
+
+
+def wrap_methods(obj, instrument, methods):
+    """
+    Time obj's methods, given as {method name: kind}, by shadowing them
+    with instance attributes. Used for tm_devices and pymeasure objects,
+    whose internal command helpers go through these methods. Wrapping
+    twice is a no-op, and the wrappers only record while a profiler is
+    active.
+    """
+    for name, kind in methods.items():
+        method = getattr(obj, name, None)
+        if method is None or getattr(method, "__profiled__", False):
+            continue
+        try:
+            setattr(obj, name, _timed_bound(instrument, kind, method))
+        except AttributeError:
+            pass  # read-only attribute; leave it untimed
+    return obj
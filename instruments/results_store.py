@@ -0,0 +1,216 @@
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS_DIR = os.path.join(BASE_DIR, "results", "runs")
+RUNS_JSONL = os.path.join(RUNS_DIR, "runs.jsonl")
+# One Parquet file per run; read the directory as a single dataset, e.g.
+# pyarrow.dataset.dataset(RUNS_DATASET) or duckdb "results/runs/steps/*.parquet".
+RUNS_DATASET = os.path.join(RUNS_DIR, "steps")
+
+# Result fields that name a file the step wrote.
+ARTIFACT_FIELDS = ("file",)
+
+# Records keep arrays and lists up to this many items; longer ones are
+# replaced by a summary, so a capture never bloats runs.jsonl. The data
+# itself belongs in the step's saved file (its artifact).
+SUMMARY_MAX_ITEMS = 16
+SUMMARY_MAX_CHARS = 500
+
+
+def to_json(value):
+    """
+    json.dump default for step results: NumPy values become lists and
+    scalars, anything else its string form.
+    """
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def summarize(value):
+    """
+    Compact, JSON-friendly form of a step parameter or result: scalars and
+    short containers are kept, long arrays and lists become
+    {"shape", "dtype", "min", "max", "mean"} summaries, long strings are
+    truncated and bytes are replaced by their length.
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        if value.size <= SUMMARY_MAX_ITEMS:
+            return value.tolist()
+        return _array_summary(value)
+    if isinstance(value, dict):
+        return {str(k): summarize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        if len(value) <= SUMMARY_MAX_ITEMS:
+            return [summarize(v) for v in value]
+        try:
+            array = np.asarray(value)
+        except ValueError:
+            array = None
+        if array is not None and array.dtype.kind in "biuf":
+            return _array_summary(array)
+        return [summarize(v) for v in value[:SUMMARY_MAX_ITEMS]] + [f"... {len(value) - SUMMARY_MAX_ITEMS} more"]
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, str) and len(value) > SUMMARY_MAX_CHARS:
+        return value[:SUMMARY_MAX_CHARS] + f"... ({len(value)} chars)"
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return summarize(str(value))
+
+
+def _array_summary(array):
+    summary = {"shape": list(array.shape), "dtype": str(array.dtype)}
+    if array.size and array.dtype.kind in "biuf":
+        summary.update(
+            min=float(np.nanmin(array)), max=float(np.nanmax(array)), mean=float(np.nanmean(array))
+        )
+    return summary
+
+
+def _timestamp(t):
+    return datetime.fromtimestamp(t).isoformat()
+
+
+def _artifacts(result):
+    if not isinstance(result, dict):
+        return []
+    return [result[f] for f in ARTIFACT_FIELDS if isinstance(result.get(f), str) and result[f]]
+
+
+class RunRecorder:
+    """
+    Collects one record per executed step while a plan runs. Steps inside
+    loops are recorded once per iteration, with the loop variables.
+    """
+
+    def __init__(self, routine, plan_key=None):
+        self.run_id = uuid.uuid4().hex
+        self.routine = routine
+        self.plan_key = plan_key
+        self.started = time.time()
+        self.steps = []
+        self._lock = threading.Lock()
+
+    def step(self, node, params, result, start, end, loop_vars=None, error=None):
+        """
+        Record a finished step. params and result are stored summarized
+        (see summarize); files the result names are kept as artifacts.
+        """
+        record = {
+            "index": node.index,
+            "id": node.id,
+            "action": node.action,
+            "instrument": node.instrument,
+            "params": summarize(params),
+            "loop": summarize(dict(loop_vars)) if loop_vars else None,
+            "start": _timestamp(start),
+            "end": _timestamp(end),
+            "duration_s": end - start,
+            "status": "failed" if error is not None else "passed",
+            "error": f"{type(error).__name__}: {error}" if error is not None else None,
+            "result": summarize(result),
+            "artifacts": _artifacts(result),
+        }
+        # Parallel lanes record from several threads.
+        with self._lock:
+            self.steps.append(record)
+
+    def finish(self, error=None):
+        """
+        The complete run record.
+        """
+        ended = time.time()
+        return {
+            "run_id": self.run_id,
+            "routine": self.routine,
+            "plan_key": self.plan_key,
+            "start": _timestamp(self.started),
+            "end": _timestamp(ended),
+            "duration_s": ended - self.started,
+            "status": "failed" if error is not None else "passed",
+            "error": f"{type(error).__name__}: {error}" if error is not None else None,
+            "artifacts": [a for s in self.steps for a in s["artifacts"]],
+            "steps": self.steps,
+        }
+
+
+# ----------------------------------------------------------------------
+# Storage
+# ----------------------------------------------------------------------
+
+def append_jsonl(record, path=RUNS_JSONL):
+    """
+    Append a run record as one JSON line. The line goes out in a single
+    write on an O_APPEND descriptor, so records appended concurrently by
+    several processes (run_benches workers) never interleave.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    line = (json.dumps(record, default=to_json) + "\n").encode("utf-8")
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        written = os.write(fd, line)
+    finally:
+        os.close(fd)
+    if written != len(line):
+        raise RuntimeError(f"Short write appending run record to {path}")
+    return path
+
+
+def append_parquet(record, dataset=RUNS_DATASET):
+    """
+    Add a run's steps, one row each, to the Parquet dataset. Parameters
+    and results are stored as JSON strings. Requires pyarrow.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("Saving runs as Parquet requires pyarrow (pip install pyarrow)") from e
+
+    steps = record["steps"]
+    table = pa.table({
+        "run_id": [record["run_id"]] * len(steps),
+        "routine": [record["routine"]] * len(steps),
+        "run_status": [record["status"]] * len(steps),
+        "index": [s["index"] for s in steps],
+        "id": [s["id"] for s in steps],
+        "action": [s["action"] for s in steps],
+        "instrument": [s["instrument"] for s in steps],
+        "start": pa.array([datetime.fromisoformat(s["start"]) for s in steps], pa.timestamp("us")),
+        "end": pa.array([datetime.fromisoformat(s["end"]) for s in steps], pa.timestamp("us")),
+        "duration_s": pa.array([s["duration_s"] for s in steps], pa.float64()),
+        "status": [s["status"] for s in steps],
+        "error": pa.array([s["error"] for s in steps], pa.string()),
+        "params": [json.dumps(s["params"], default=to_json) for s in steps],
+        "loop": [json.dumps(s["loop"], default=to_json) for s in steps],
+        "result": [json.dumps(s["result"], default=to_json) for s in steps],
+        "artifacts": pa.array([s["artifacts"] for s in steps], pa.list_(pa.string())),
+    })
+
+    os.makedirs(dataset, exist_ok=True)
+    path = os.path.join(dataset, f"{record['start'][:10]}-{record['run_id']}.parquet")
+    pq.write_table(table, path)
+    return path
+
+
+def save_run(record, parquet=False):
+    """
+    Store a finished run: always as JSONL, and in the Parquet dataset
+    when parquet is set. Returns the paths written.
+    """
+    paths = [append_jsonl(record)]
+    if parquet:
+        paths.append(append_parquet(record))
+    return paths
@@ -1,63 +1,158 @@
+import os
+import time
+
+import numpy as np
+
 from instruments.instrument_base import Instrument
+from instruments.log import get_logger
+from instruments.transports import DEFAULT_TRANSPORT
+from instruments.waveform_io import load_waveforms
+
+log = get_logger("rigol_dg1062z")
+
+WAVEFORM_FUNCTIONS = {
+    "sine": "SIN",
+    "square": "SQU",
+    "ramp": "RAMP",
+}
+
+# DG1000Z arbitrary memory takes 14-bit codes sent as 16-bit words,
+# at most 16384 points per DATA:DAC16 packet.
+ARB_DAC_MAX = 16383
+ARB_PACKET_POINTS = 16384
+
+SWEEP_SPACINGS = {
+    "linear": "LIN",
+    "log": "LOG",
+}
+
+TRIGGER_SOURCES = {
+    "internal": "INT",
+    "external": "EXT",
+    "manual": "MAN",
+}
+
+BURST_MODES = {
+    "triggered": "TRIG",
+    "gated": "GAT",
+    "infinite": "INF",
+}
+
 
 class RigolDG1062Z(Instrument):
     """
     RigolDG1062Z driver implemented using pyvisa
     """
+
+    def __init__(self, ip_address, timeout=5000, transport=DEFAULT_TRANSPORT):
+        super().__init__(ip_address, timeout, transport)
+        # Last settings written to each channel. Used to skip commands
+        # whose value the instrument already holds.
+        self._state = {}
+
+    def connect(self):
+        self.invalidate_state()
+        return super().connect()
+
+    async def aconnect(self, *args, **kwargs):
+        self.invalidate_state()
+        return await super().aconnect(*args, **kwargs)
+
+    def reset(self):
+        super().reset()
+        self.invalidate_state()
+
+    # -------------------------------
+    # Shadow state
+    # -------------------------------
+    def _channel_state(self, channel):
+        return self._state.setdefault(channel, {})
+
+    def invalidate_state(self, channel=None):
+        """
+        Forget cached settings, e.g. after front-panel changes.
+        """
+        if channel is None:
+            self._state.clear()
+        else:
+            self._state.pop(channel, None)
+
     # -------------------------------
     # Waveform configuration
     # -------------------------------
     def set_function(self, channel, func):
         self.write(f"SOUR{channel}:FUNC {func}")
+        self._channel_state(channel)["function"] = func
 
     def set_frequency(self, channel, freq_hz):
         self.write(f"SOUR{channel}:FREQ {freq_hz}")
+        self._channel_state(channel)["frequency"] = freq_hz
 
     def set_amplitude(self, channel, volts_pkpk):
         self.write(f"SOUR{channel}:VOLT {volts_pkpk}")
+        self._channel_state(channel)["amplitude"] = volts_pkpk
 
     def set_offset(self, channel, offset_v):
         self.write(f"SOUR{channel}:VOLT:OFFS {offset_v}")
+        self._channel_state(channel)["offset"] = offset_v
+
+    def apply(self, channel, func, freq, amp, offset=0.0):
+        """
+        Set shape, frequency, amplitude and offset in a single
+        SOUR<n>:APPL:<func> message.
+        """
+        self.write(f"SOUR{channel}:APPL:{func} {freq},{amp},{offset}")
+        self._channel_state(channel).update(
+            function=func,
+            frequency=freq,
+            amplitude=amp,
+            offset=offset,
+        )
 
     def output_on(self, channel):
         self.write(f"OUTP{channel} ON")
+        self._channel_state(channel)["output"] = True
 
     def output_off(self, channel):
         self.write(f"OUTP{channel} OFF")
+        self._channel_state(channel)["output"] = False
 
     # -------------------------------
     # Composite helper (no changes needed)
     # -------------------------------
     def configure_sine(self, channel, freq, amplitude, offset=0):
-        self.set_function(channel, "SIN")
-        self.set_frequency(channel, freq)
-        self.set_amplitude(channel, amplitude)
-        self.set_offset(channel, offset)
+        self.apply(channel, "SIN", freq, amplitude, offset)
 
     # -------------------------------
     # Load settings
     # -------------------------------
     def high_impedance_mode(self, channel):
-        self.write(f"OUTP{channel}:LOAD INF")
+        self.set_load(channel, "INF")
 
     def fifty_ohm_mode(self, channel):
-        self.write(f"OUTP{channel}:LOAD 50")
+        self.set_load(channel, "50")
 
     # -------------------------------
     # IDN
     # -------------------------------
     def id(self):
         return self.query("*IDN?")
-    
+
+    def _load_setting(self, impedance):
+        imp = impedance.lower()
+        if imp in ("50ohm", "50"):
+            return "50"
+        if imp in ("highz", "high-z", "inf", "infinite"):
+            return "INF"
+        raise ValueError(f"Unsupported output impedance: {imp}")
+
+    def set_load(self, channel, load):
+        self.write(f"OUTP{channel}:LOAD {load}")
+        self._channel_state(channel)["load"] = load
+
     def configure_output(self, channel, impedance=None, enabled=None):
         if impedance:
-            imp = impedance.lower()
-            if imp in ("50ohm", "50"):
-                self.fifty_ohm_mode(channel)
-            elif imp in ("highz", "high-z", "inf", "infinite"):
-                self.high_impedance_mode(channel)
-            else:
-                raise ValueError(f"Unsupported output impedance: {imp}")
+            self.set_load(channel, self._load_setting(impedance))
 
         if enabled is not None:
             if enabled:
@@ -71,53 +166,92 @@ class RigolDG1062Z(Instrument):
             "output_enabled": enabled,
         }
 
-    
+    def _update_waveform(self, channel, func, freq, amp, offset):
+        """
+        Bring the channel to the requested settings, writing only what
+        differs from the shadow state. A change of shape, or of more than
+        one numeric parameter, is sent as one APPLy command.
+        """
+        state = self._channel_state(channel)
+
+        wanted = {"frequency": freq, "amplitude": amp, "offset": offset}
+        changed = [
+            key for key, value in wanted.items()
+            if value is not None and state.get(key) != value
+        ]
+        func_changed = state.get("function") != func
+
+        if not func_changed and not changed:
+            return
+
+        # APPLy needs every numeric value; fall back to the cache for
+        # parameters the caller left out.
+        full_freq = freq if freq is not None else state.get("frequency")
+        full_amp = amp if amp is not None else state.get("amplitude")
+        can_apply = full_freq is not None and full_amp is not None
+
+        if can_apply and (func_changed or len(changed) > 1):
+            self.apply(channel, func, full_freq, full_amp, offset)
+            return
+
+        if func_changed:
+            self.set_function(channel, func)
+
+        setters = {
+            "frequency": self.set_frequency,
+            "amplitude": self.set_amplitude,
+            "offset": self.set_offset,
+        }
+        for key in changed:
+            setters[key](channel, wanted[key])
+
+    def _update_output(self, channel, impedance, enabled):
+        state = self._channel_state(channel)
+
+        if impedance:
+            load = self._load_setting(impedance)
+            if state.get("load") != load:
+                self.set_load(channel, load)
+
+        if enabled is not None and state.get("output") != bool(enabled):
+            if enabled:
+                self.output_on(channel)
+            else:
+                self.output_off(channel)
+
     def start_waveform(self, channel, waveform, output=None):
         """
         Configure waveform parameters and start waveform output.
 
         By default, output is enabled unless explicitly disabled.
+        Settings already present on the channel are not re-sent, so
+        changing a single parameter costs one SCPI message.
         """
 
         # --- 1. Waveform type ---
         wtype = waveform["type"].lower()
 
-        if wtype == "sine":
-            func = "SIN"
-        elif wtype == "square":
-            func = "SQU"
-        elif wtype == "ramp":
-            func = "RAMP"
-        else:
+        if wtype not in WAVEFORM_FUNCTIONS:
             raise ValueError(f"Unsupported waveform type: {wtype}")
 
-        self.set_function(channel, func)
+        func = WAVEFORM_FUNCTIONS[wtype]
 
         # --- 2. Basic parameters ---
         freq = waveform.get("frequency")
         amp = waveform.get("amplitude")
         offset = waveform.get("offset", 0.0)
 
-        if freq is not None:
-            self.set_frequency(channel, freq)
-
-        if amp is not None:
-            self.set_amplitude(channel, amp)
-
-        self.set_offset(channel, offset)
+        self._set_mode(channel, None)
+        self._update_waveform(channel, func, freq, amp, offset)
 
         # --- 3. Output handling (explicit defaults) ---
         output = output or {}
         enabled = output.get("enabled", True)
         impedance = output.get("impedance")
 
-        output_state = self.configure_output(
-            channel=channel,
-            impedance=impedance,
-            enabled=enabled,
-        )
+        self._update_output(channel, impedance, enabled)
 
-        print(f"[RigolDG1062Z] Channel {channel} waveform started.")
+        log.info("[RigolDG1062Z] Channel %s waveform started.", channel)
 
         # --- 4. Return structured state ---
         return {
@@ -126,14 +260,356 @@ class RigolDG1062Z(Instrument):
             "frequency": freq,
             "amplitude": amp,
             "offset": offset,
-            **output_state,
+            "impedance": impedance,
+            "output_enabled": enabled,
         }
 
 
     def stop_waveform(self, channel):
         self.output_off(channel)
-        print(f"[RigolDG1062Z] Channel {channel} waveform stopped.")
+        log.info("[RigolDG1062Z] Channel %s waveform stopped.", channel)
         return {
             "channel": channel,
             "output_enabled": False,
         }
+
+    # -------------------------------
+    # Sweep / burst modes
+    # -------------------------------
+    def _set_mode(self, channel, mode):
+        """
+        Switch between continuous output (None), "sweep" and "burst".
+        Only the subsystem known to be active is turned off. After connect()
+        or invalidate_state() the mode is unknown (a sweep or burst may be
+        left on from an earlier run or the front panel), so both are
+        turned off.
+        """
+        state = self._channel_state(channel)
+        known = "mode" in state
+        current = state.get("mode")
+
+        if known and current == mode:
+            return
+
+        if (current == "sweep" or not known) and mode != "sweep":
+            self.write(f"SOUR{channel}:SWE:STAT OFF")
+        if (current == "burst" or not known) and mode != "burst":
+            self.write(f"SOUR{channel}:BURS OFF")
+
+        if mode == "sweep":
+            self.write(f"SOUR{channel}:SWE:STAT ON")
+        elif mode == "burst":
+            self.write(f"SOUR{channel}:BURS ON")
+
+        state["mode"] = mode
+
+    def _lookup(self, table, value, name):
+        key = str(value).lower()
+        if key not in table:
+            raise ValueError(
+                f"Unsupported {name}: {value} (expected one of {', '.join(table)})"
+            )
+        return table[key]
+
+    def set_trigger_out(self, channel, trigger_out="off"):
+        """
+        Drive the rear-panel trigger output on each sweep/burst start.
+        """
+        slope = str(trigger_out).lower()
+        if slope == "off":
+            self.write(f"OUTP{channel}:TRIG OFF")
+            return
+
+        if slope not in ("positive", "negative"):
+            raise ValueError(f"Unsupported trigger_out: {trigger_out}")
+
+        self.write(f"OUTP{channel}:TRIG:SLOP {slope[:3].upper()}")
+        self.write(f"OUTP{channel}:TRIG ON")
+
+    def _prepare_carrier(self, channel, waveform, freq):
+        if not waveform:
+            return None
+        wtype = waveform.get("type", "sine").lower()
+        if wtype not in WAVEFORM_FUNCTIONS:
+            raise ValueError(f"Unsupported waveform type: {wtype}")
+        self._update_waveform(
+            channel,
+            WAVEFORM_FUNCTIONS[wtype],
+            waveform.get("frequency", freq),
+            waveform.get("amplitude"),
+            waveform.get("offset", 0.0),
+        )
+        return wtype
+
+    def configure_sweep(
+        self,
+        channel,
+        start,
+        stop,
+        sweep_time,
+        spacing="linear",
+        trigger_source="internal",
+        trigger_out="off",
+        hold_start=None,
+        hold_stop=None,
+        return_time=None,
+        waveform=None,
+        output=None,
+    ):
+        """
+        Run the instrument's built-in frequency sweep from start to stop
+        over sweep_time seconds. The generator does the stepping; with a
+        manual trigger source, call trigger() to start each sweep.
+        """
+        spac = self._lookup(SWEEP_SPACINGS, spacing, "sweep spacing")
+        trig = self._lookup(TRIGGER_SOURCES, trigger_source, "trigger source")
+
+        wtype = self._prepare_carrier(channel, waveform, start)
+
+        self._set_mode(channel, "sweep")
+        self.write(f"SOUR{channel}:SWE:SPAC {spac}")
+        self.write(f"SOUR{channel}:FREQ:STAR {start}")
+        self.write(f"SOUR{channel}:FREQ:STOP {stop}")
+        self.write(f"SOUR{channel}:SWE:TIME {sweep_time}")
+
+        if hold_start is not None:
+            self.write(f"SOUR{channel}:SWE:HTIM:STAR {hold_start}")
+        if hold_stop is not None:
+            self.write(f"SOUR{channel}:SWE:HTIM {hold_stop}")
+        if return_time is not None:
+            self.write(f"SOUR{channel}:SWE:RTIM {return_time}")
+
+        self.write(f"SOUR{channel}:SWE:TRIG:SOUR {trig}")
+        self.set_trigger_out(channel, trigger_out)
+
+        # The carrier frequency is no longer a fixed value.
+        self._channel_state(channel).pop("frequency", None)
+
+        output = output or {}
+        enabled = output.get("enabled", True)
+        impedance = output.get("impedance")
+        self._update_output(channel, impedance, enabled)
+
+        log.info("[RigolDG1062Z] Channel %s sweep %s -> %s Hz configured.", channel, start, stop)
+
+        return {
+            "channel": channel,
+            "mode": "sweep",
+            "waveform": wtype,
+            "start": start,
+            "stop": stop,
+            "sweep_time": sweep_time,
+            "spacing": str(spacing).lower(),
+            "trigger_source": str(trigger_source).lower(),
+            "trigger_out": str(trigger_out).lower(),
+            "impedance": impedance,
+            "output_enabled": enabled,
+        }
+
+    def configure_burst(
+        self,
+        channel,
+        cycles=1,
+        mode="triggered",
+        period=None,
+        trigger_source="internal",
+        trigger_out="off",
+        delay=None,
+        phase=None,
+        waveform=None,
+        output=None,
+    ):
+        """
+        Emit N-cycle bursts of the current waveform. With an internal
+        trigger source, bursts repeat every period seconds.
+        """
+        burst_mode = self._lookup(BURST_MODES, mode, "burst mode")
+        trig = self._lookup(TRIGGER_SOURCES, trigger_source, "trigger source")
+
+        wtype = self._prepare_carrier(channel, waveform, None)
+
+        self._set_mode(channel, "burst")
+        self.write(f"SOUR{channel}:BURS:MODE {burst_mode}")
+
+        if burst_mode == "TRIG":
+            self.write(f"SOUR{channel}:BURS:NCYC {int(cycles)}")
+
+        if period is not None:
+            self.write(f"SOUR{channel}:BURS:INT:PER {period}")
+        if delay is not None:
+            self.write(f"SOUR{channel}:BURS:TDEL {delay}")
+        if phase is not None:
+            self.write(f"SOUR{channel}:BURS:PHAS {phase}")
+
+        self.write(f"SOUR{channel}:BURS:TRIG:SOUR {trig}")
+        self.set_trigger_out(channel, trigger_out)
+
+        output = output or {}
+        enabled = output.get("enabled", True)
+        impedance = output.get("impedance")
+        self._update_output(channel, impedance, enabled)
+
+        log.info("[RigolDG1062Z] Channel %s burst (%s) configured.", channel, mode)
+
+        return {
+            "channel": channel,
+            "mode": "burst",
+            "waveform": wtype,
+            "burst_mode": str(mode).lower(),
+            "cycles": int(cycles),
+            "period": period,
+            "trigger_source": str(trigger_source).lower(),
+            "trigger_out": str(trigger_out).lower(),
+            "impedance": impedance,
+            "output_enabled": enabled,
+        }
+
+    def trigger(self, channel):
+        """
+        Software-trigger the active sweep or burst on a channel.
+        """
+        mode = self._channel_state(channel).get("mode")
+
+        if mode == "sweep":
+            self.write(f"SOUR{channel}:SWE:TRIG:IMM")
+        elif mode == "burst":
+            self.write(f"SOUR{channel}:BURS:TRIG:IMM")
+        else:
+            raise RuntimeError(
+                f"Channel {channel} has no sweep or burst configured"
+            )
+
+        return {
+            "channel": channel,
+            "mode": mode,
+            "triggered_at": time.time(),
+        }
+
+    # -------------------------------
+    # Arbitrary waveforms
+    # -------------------------------
+    def _load_arbitrary_samples(self, data=None, file=None, column=None):
+        """
+        Return (samples, sample_interval) from an array or a file.
+
+        Scope captures (.csv or .npz, see waveform_io) carry a "t" column,
+        which is used to infer the sample interval.
+        """
+        if data is not None:
+            return np.asarray(data, dtype=float).ravel(), None
+
+        if file is None:
+            raise ValueError("wavegen_load_arbitrary requires 'data' or 'file'")
+
+        ext = os.path.splitext(file)[1].lower()
+
+        if ext == ".npy":
+            return np.load(file).astype(float).ravel(), None
+
+        if ext not in (".csv", ".npz"):
+            raise ValueError(f"Unsupported arbitrary waveform file type: {ext}")
+
+        t, channels, _ = load_waveforms(file)
+
+        if column is None:
+            if not channels:
+                raise ValueError(f"No data column found in {file}")
+            column = next(iter(channels))
+
+        if column not in channels:
+            raise ValueError(f"Column '{column}' not found in {file}")
+
+        dt = float(np.median(np.diff(t))) if len(t) > 1 else None
+        return np.asarray(channels[column], dtype=float).ravel(), dt
+
+    def load_arbitrary(
+        self,
+        channel,
+        data=None,
+        file=None,
+        column=None,
+        sample_rate=None,
+        chunk_size=ARB_PACKET_POINTS,
+        output=None,
+    ):
+        """
+        Scale samples to DAC codes and upload them to volatile arbitrary
+        memory as binary DATA:DAC16 packets.
+
+        Amplitude and offset are set from the data range, so the output
+        reproduces the recorded voltages.
+        """
+        samples, dt = self._load_arbitrary_samples(data, file, column)
+
+        if samples.size < 2:
+            raise ValueError("Arbitrary waveform needs at least 2 points")
+
+        if sample_rate is None:
+            if not dt:
+                raise ValueError(
+                    "sample_rate is required when the data has no time column"
+                )
+            sample_rate = 1.0 / dt
+
+        chunk_size = int(min(chunk_size, ARB_PACKET_POINTS))
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be positive")
+
+        vmin = float(samples.min())
+        vmax = float(samples.max())
+        if vmax == vmin:
+            raise ValueError("Arbitrary waveform data is constant")
+
+        codes = np.rint((samples - vmin) * (ARB_DAC_MAX / (vmax - vmin)))
+        payload = codes.astype("<u2")
+
+        amplitude = vmax - vmin
+        offset = (vmax + vmin) / 2.0
+
+        self._set_mode(channel, None)
+        self.write(f"SOUR{channel}:APPL:ARB {sample_rate}")
+        state = self._channel_state(channel)
+        state["function"] = "ARB"
+        state.pop("frequency", None)
+        self.set_amplitude(channel, amplitude)
+        self.set_offset(channel, offset)
+
+        t0 = time.perf_counter()
+        chunks = 0
+        for start in range(0, payload.size, chunk_size):
+            block = payload[start:start + chunk_size]
+            flag = "END" if start + chunk_size >= payload.size else "CON"
+            self.write_binary_block(
+                f"SOUR{channel}:TRAC:DATA:DAC16 VOLATILE,{flag},",
+                block.tobytes(),
+            )
+            chunks += 1
+        # Block until the instrument has consumed the upload.
+        self.query("*OPC?")
+        elapsed = time.perf_counter() - t0
+
+        output = output or {}
+        enabled = output.get("enabled", True)
+        impedance = output.get("impedance")
+        self._update_output(channel, impedance, enabled)
+
+        points_per_s = samples.size / elapsed if elapsed > 0 else float("inf")
+        log.info(
+            "[RigolDG1062Z] Channel %s: uploaded %d points in %.1f ms (%.1f kpts/s).",
+            channel, samples.size, elapsed * 1e3, points_per_s / 1e3,
+        )
+
+        return {
+            "channel": channel,
+            "waveform": "arb",
+            "points": int(samples.size),
+            "sample_rate": float(sample_rate),
+            "amplitude": amplitude,
+            "offset": offset,
+            "chunks": chunks,
+            "bytes": int(payload.nbytes),
+            "upload_time": elapsed,
+            "points_per_s": points_per_s,
+            "impedance": impedance,
+            "output_enabled": enabled,
+        }
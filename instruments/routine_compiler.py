@@ -0,0 +1,684 @@
+import json
+import os
+import re
+from collections import namedtuple
+from collections.abc import Mapping
+
+from instruments import cache
+from instruments.transports import TRANSPORTS
+from instruments.step_dispatcher import (
+    SCHEMA_PATH,
+    Ref,
+    coerce_type,
+    compile_refs,
+    get_action_table,
+)
+
+# Bump when the plan layout or validation changes so stale cache entries
+# are ignored.
+PLAN_VERSION = "5"
+
+# Step keys handled by the runner rather than passed to the action.
+STEP_KEYS = ("id", "action", "instrument", "delay_before", "delay_after")
+
+# Step ids are referenced as $steps.<id>.
+STEP_ID_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_-]*$")
+
+# Block keys that introduce a loop over a nested list of steps.
+LOOP_KINDS = ("repeat", "foreach", "sweep")
+
+# Result key holding a loop's own metadata ({"iterations": n}), kept apart
+# from the fields collected from its body.
+LOOP_INFO_KEY = "_loop"
+
+# Block keys that run their nested steps concurrently.
+PARALLEL_KINDS = ("parallel",)
+
+SWEEP_SPACINGS = ("linear", "log")
+
+CompiledStep = namedtuple(
+    "CompiledStep",
+    [
+        "index",         # position label, e.g. "3" or "3.2" inside a loop
+        "id",            # optional name for $steps.<id> references
+        "action",
+        "instrument",
+        "params",        # tuple of (key, value); static values already coerced,
+                         # reference strings replaced by Refs
+        "refs",          # keys whose value contains a Ref
+        "delay_before",
+        "delay_after",
+        "uses",          # sorted tuple of instrument names the step talks to
+    ],
+)
+
+CompiledLoop = namedtuple(
+    "CompiledLoop",
+    [
+        "index",
+        "id",
+        "kind",          # one of LOOP_KINDS
+        "var",           # loop variable name, referenced as $loop.<var>
+        "spec",          # tuple of (key, value) describing the loop values
+        "body",          # tuple of compiled nodes
+        "uses",
+    ],
+)
+
+CompiledParallel = namedtuple(
+    "CompiledParallel",
+    [
+        "index",
+        "id",
+        "keys",          # result keys of the children, in routine order
+        "lanes",         # tuple of lanes; each a tuple of (result key, node)
+                         # run in order, one lane per group of instruments
+        "uses",
+    ],
+)
+
+ExecutionPlan = namedtuple("ExecutionPlan", ["key", "instruments", "steps"])
+
+# Stands in for the previous action when checking references.
+_PreviousSpec = namedtuple("_PreviousSpec", ["name", "returns"])
+
+
+class RoutineError(ValueError):
+    """
+    Raised when a routine fails validation. Holds every problem found.
+    """
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        super().__init__(
+            f"{len(self.errors)} problem(s) in routine:\n"
+            + "\n".join(f"  - {e}" for e in self.errors)
+        )
+
+
+class _Context:
+    """
+    What the steps of one routine can see while it is being compiled.
+    """
+
+    def __init__(self, instrument_names, errors):
+        self.instrument_names = instrument_names
+        self.errors = errors
+        # step id -> spec of the step (or loop) that defined it
+        self.ids = {}
+
+
+def _check_enum(where, key, value, info, errors):
+    allowed = info.get("enum")
+    if allowed and value is not None and not isinstance(value, Ref) and value not in allowed:
+        errors.append(
+            f"{where}: '{key}' must be one of {allowed}, got {value!r}"
+        )
+
+
+def _check_param(where, key, value, info, errors):
+    """
+    Coerce a static parameter value and check enums, including one level
+    of nested dict properties. Returns the coerced value.
+    """
+    ptype = info.get("type")
+    if ptype:
+        try:
+            value = coerce_type(value, ptype)
+        except (TypeError, ValueError) as e:
+            errors.append(f"{where}: invalid value for '{key}' ({ptype}): {e}")
+            return value
+
+    _check_enum(where, key, value, info, errors)
+
+    if ptype == "dict" and isinstance(value, dict):
+        for sub_key, sub_info in (info.get("properties") or {}).items():
+            if isinstance(sub_info, dict) and sub_key in value:
+                _check_enum(where, f"{key}.{sub_key}", value[sub_key], sub_info, errors)
+
+    return value
+
+
+def _check_field(where, key, ref, spec, errors):
+    """
+    Check the first field of a reference path against spec's returns.
+    """
+    if not ref.path or not isinstance(ref.path[0], str):
+        return
+    field = ref.path[0]
+    properties = (spec.returns or {}).get("properties")
+    if properties and field not in properties:
+        errors.append(
+            f"{where}: '{key}' uses {ref.text} but {spec.name} returns "
+            f"no field '{field}' (has: {', '.join(properties)})"
+        )
+
+
+def _compile_value(where, key, value, previous, loop_vars, ctx):
+    """
+    Parse reference strings in value into Refs and check what they point
+    at. Returns (value, has_refs).
+    """
+    refs = []
+    try:
+        value = compile_refs(value, refs)
+    except ValueError as e:
+        ctx.errors.append(f"{where}: '{key}': {e}")
+        return value, True
+
+    for ref in refs:
+        if ref.source == "loop":
+            if ref.name not in loop_vars:
+                ctx.errors.append(f"{where}: '{key}' uses {ref.text} outside a loop defining it")
+        elif ref.source == "steps":
+            spec = ctx.ids.get(ref.name)
+            if spec is None:
+                ctx.errors.append(
+                    f"{where}: '{key}' uses {ref.text} but no earlier step has id '{ref.name}'"
+                )
+            else:
+                _check_field(where, key, ref, spec, ctx.errors)
+        elif previous is None:
+            ctx.errors.append(f"{where}: '{key}' uses {ref.text} but there is no previous step")
+        else:
+            _check_field(where, key, ref, previous, ctx.errors)
+
+    return value, bool(refs)
+
+
+def _check_id(where, block, ctx):
+    step_id = block.get("id")
+    if step_id is None:
+        return None
+    if not isinstance(step_id, str) or not STEP_ID_PATTERN.match(step_id):
+        ctx.errors.append(f"{where}: invalid id {step_id!r}")
+        return None
+    if step_id in ctx.ids:
+        ctx.errors.append(f"{where}: duplicate id '{step_id}'")
+    return step_id
+
+
+def _compile_step(index, step, previous, loop_vars, ctx):
+    where = f"step {index}"
+    errors = ctx.errors
+
+    if not isinstance(step, dict):
+        errors.append(f"{where}: expected a mapping, got {type(step).__name__}")
+        return None, None
+
+    action = step.get("action")
+    if not action:
+        errors.append(f"{where}: missing 'action'")
+        return None, None
+
+    where = f"step {index} ({action})"
+    spec = get_action_table().get(action)
+    if spec is None:
+        errors.append(f"{where}: unknown action")
+        return None, None
+
+    step_id = _check_id(where, step, ctx)
+
+    instrument = step.get("instrument")
+    if spec.instrument == "local":
+        instrument = instrument or "local"
+    elif instrument is None:
+        errors.append(f"{where}: missing 'instrument'")
+    elif instrument not in ctx.instrument_names:
+        errors.append(f"{where}: instrument '{instrument}' is not in the instruments block")
+    elif instrument != spec.instrument:
+        errors.append(
+            f"{where}: action runs on '{spec.instrument}', not '{instrument}'"
+        )
+
+    delays = {}
+    for key in ("delay_before", "delay_after"):
+        value = step.get(key)
+        if value is None:
+            delays[key] = None
+            continue
+        try:
+            value = float(value)
+            if value < 0:
+                raise ValueError("must not be negative")
+        except (TypeError, ValueError) as e:
+            errors.append(f"{where}: invalid '{key}': {e}")
+            value = None
+        delays[key] = value
+
+    params = []
+    refs = []
+    for key, value in step.items():
+        if key in STEP_KEYS:
+            continue
+
+        info = spec.params.get(key)
+        if info is None:
+            errors.append(f"{where}: unknown parameter '{key}'")
+            continue
+
+        value, has_refs = _compile_value(where, key, value, previous, loop_vars, ctx)
+        if has_refs:
+            refs.append(key)
+            # Nested references are resolved at run time; enums on the
+            # static parts can still be checked now.
+            if isinstance(value, dict):
+                _check_param(where, key, value, info, errors)
+        else:
+            value = _check_param(where, key, value, info, errors)
+
+        params.append((key, value))
+
+    for key, info in spec.params.items():
+        if info.get("required") and key not in step:
+            errors.append(f"{where}: missing required parameter '{key}'")
+
+    if action == "run_script":
+        script = dict(params).get("script")
+        if isinstance(script, str) and not os.path.isfile(script):
+            errors.append(f"{where}: script not found: {script}")
+
+    if step_id is not None:
+        ctx.ids[step_id] = spec
+
+    # Instruments passed as parameters (e.g. the wavegen for
+    # frequency_response) are used by the step as well.
+    uses = {instrument} if instrument else set()
+    static = dict(params)
+    for key, info in spec.params.items():
+        if info.get("type") == "instrument":
+            name = static.get(key, info.get("default"))
+            if isinstance(name, str):
+                uses.add(name)
+
+    compiled = CompiledStep(
+        index=index,
+        id=step_id,
+        action=action,
+        instrument=instrument,
+        params=tuple(params),
+        refs=tuple(refs),
+        delay_before=delays["delay_before"],
+        delay_after=delays["delay_after"],
+        uses=tuple(sorted(uses)),
+    )
+    return compiled, spec
+
+
+def _loop_spec(where, kind, block, errors):
+    """
+    Check the loop-value keys of a block. Returns a dict of coerced values.
+    """
+    spec = {}
+
+    def number(key, convert=float, required=True):
+        if key not in block:
+            if required:
+                errors.append(f"{where}: missing '{key}'")
+            return None
+        try:
+            return convert(block[key])
+        except (TypeError, ValueError):
+            errors.append(f"{where}: invalid '{key}': {block[key]!r}")
+            return None
+
+    if kind == "repeat":
+        count = number("count", int)
+        if count is not None and count < 0:
+            errors.append(f"{where}: 'count' must not be negative")
+        spec["count"] = count
+
+    elif kind == "foreach":
+        values = block.get("values")
+        if values is None:
+            errors.append(f"{where}: missing 'values'")
+        spec["values"] = values
+
+    else:
+        spec["start"] = number("start")
+        spec["stop"] = number("stop")
+        spec["step"] = number("step", required=False)
+        spec["points"] = number("points", int, required=False)
+        spec["spacing"] = block.get("spacing", "linear")
+
+        if (spec["step"] is None) == (spec["points"] is None):
+            errors.append(f"{where}: give exactly one of 'step' or 'points'")
+        if spec["step"] is not None and spec["step"] == 0:
+            errors.append(f"{where}: 'step' must not be zero")
+        if spec["points"] is not None and spec["points"] < 1:
+            errors.append(f"{where}: 'points' must be at least 1")
+        if spec["spacing"] not in SWEEP_SPACINGS:
+            errors.append(
+                f"{where}: 'spacing' must be one of {list(SWEEP_SPACINGS)}, "
+                f"got {spec['spacing']!r}"
+            )
+        elif spec["spacing"] == "log":
+            if spec["points"] is None:
+                errors.append(f"{where}: log spacing requires 'points'")
+            if spec["start"] is not None and spec["stop"] is not None and (
+                spec["start"] <= 0 or spec["stop"] <= 0
+            ):
+                errors.append(f"{where}: log spacing requires positive 'start' and 'stop'")
+
+    return spec
+
+
+def _block_kind(step):
+    if isinstance(step, dict) and "action" not in step and len(step) == 1:
+        kind = next(iter(step))
+        if kind in LOOP_KINDS or kind in PARALLEL_KINDS:
+            return kind
+    return None
+
+
+def _uses(nodes):
+    return tuple(sorted({name for node in nodes for name in node.uses}))
+
+
+def _compile_loop(index, kind, block, previous, loop_vars, ctx):
+    where = f"step {index} ({kind})"
+    errors = ctx.errors
+
+    if not isinstance(block, dict):
+        errors.append(f"{where}: expected a mapping")
+        return None, None
+
+    step_id = _check_id(where, block, ctx)
+
+    var = block.get("var", "i" if kind == "repeat" else None)
+    if not isinstance(var, str) or not var:
+        errors.append(f"{where}: missing 'var'")
+        var = None
+
+    spec = _loop_spec(where, kind, block, errors)
+    if kind == "foreach" and spec["values"] is not None:
+        values, _ = _compile_value(where, "values", spec["values"], previous, loop_vars, ctx)
+        if not isinstance(values, (list, Ref)):
+            errors.append(f"{where}: 'values' must be a list or a reference")
+        spec["values"] = values
+
+    allowed = {"id", "var", "steps"} | set(spec)
+    for key in block:
+        if key not in allowed:
+            errors.append(f"{where}: unknown key '{key}'")
+
+    steps = block.get("steps")
+    if not isinstance(steps, list) or not steps:
+        errors.append(f"{where}: 'steps' must be a non-empty list")
+        steps = []
+
+    inner_vars = loop_vars | {var} if var else loop_vars
+    # Later iterations see the end of the body as $last, so field checks
+    # are skipped for the first step of the body.
+    body, last = _compile_sequence(
+        steps, _PreviousSpec(kind, {}), inner_vars, ctx, f"{index}."
+    )
+
+    # A loop returns one array per field of its body's last result, plus
+    # the loop variable.
+    returns = {}
+    properties = (last.returns or {}).get("properties") if last is not None else None
+    if properties and var:
+        returns = {
+            "type": "dict",
+            "properties": {
+                var: {"type": "list"},
+                **properties,
+                LOOP_INFO_KEY: {"type": "dict", "properties": {"iterations": {"type": "int"}}},
+            },
+        }
+
+    loop_spec = _PreviousSpec(kind, returns)
+    if step_id is not None:
+        ctx.ids[step_id] = loop_spec
+
+    compiled = CompiledLoop(
+        index=index,
+        id=step_id,
+        kind=kind,
+        var=var,
+        spec=tuple(spec.items()),
+        body=body,
+        uses=_uses(body),
+    )
+    return compiled, loop_spec
+
+
+def _lanes(children):
+    """
+    Group (key, node) children so that children sharing an instrument end
+    up in the same lane, keeping their order. Local steps share a lane.
+    """
+    lanes = []  # [instrument names, child positions]
+    for position, (_, node) in enumerate(children):
+        uses = set(node.uses)
+        merged = [lane for lane in lanes if lane[0] & uses]
+        for lane in merged:
+            lanes.remove(lane)
+            uses |= lane[0]
+        positions = sorted([p for lane in merged for p in lane[1]] + [position])
+        lanes.append([uses, positions])
+    return tuple(
+        tuple(children[p] for p in positions) for _, positions in lanes
+    )
+
+
+def _compile_parallel(index, block, previous, loop_vars, ctx):
+    where = f"step {index} (parallel)"
+    errors = ctx.errors
+
+    if not isinstance(block, dict):
+        errors.append(f"{where}: expected a mapping")
+        return None, None
+
+    step_id = _check_id(where, block, ctx)
+
+    for key in block:
+        if key not in ("id", "steps"):
+            errors.append(f"{where}: unknown key '{key}'")
+
+    steps = block.get("steps")
+    if not isinstance(steps, list) or not steps:
+        errors.append(f"{where}: 'steps' must be a non-empty list")
+        steps = []
+
+    # Siblings run concurrently, so they cannot see each other's ids and
+    # $last inside the block is the result from before it.
+    visible = dict(ctx.ids)
+    defined = {}
+    children = []
+    for position, step in enumerate(steps, start=1):
+        ctx.ids = dict(visible)
+        child_index = f"{index}.{position}"
+        compiled, spec = _compile_node(child_index, step, previous, loop_vars, ctx)
+        for name, child_spec in ctx.ids.items():
+            if name not in visible:
+                if name in defined:
+                    errors.append(f"step {child_index}: duplicate id '{name}'")
+                defined[name] = child_spec
+        if compiled is None:
+            continue
+        name = getattr(compiled, "action", None) or _block_kind(step)
+        key = compiled.id or f"{name}_{position}"
+        children.append((key, compiled))
+    ctx.ids = {**visible, **defined}
+
+    returns = {
+        "type": "dict",
+        "properties": {key: {"type": "dict"} for key, _ in children},
+    }
+    parallel_spec = _PreviousSpec("parallel", returns)
+    if step_id is not None:
+        ctx.ids[step_id] = parallel_spec
+
+    compiled = CompiledParallel(
+        index=index,
+        id=step_id,
+        keys=tuple(key for key, _ in children),
+        lanes=_lanes(children),
+        uses=_uses([node for _, node in children]),
+    )
+    return compiled, parallel_spec
+
+
+def _compile_node(index, step, previous, loop_vars, ctx):
+    kind = _block_kind(step)
+    if kind in LOOP_KINDS:
+        return _compile_loop(index, kind, step[kind], previous, loop_vars, ctx)
+    if kind in PARALLEL_KINDS:
+        return _compile_parallel(index, step[kind], previous, loop_vars, ctx)
+    return _compile_step(index, step, previous, loop_vars, ctx)
+
+
+def _compile_sequence(sequence, previous, loop_vars, ctx, prefix=""):
+    nodes = []
+    for position, step in enumerate(sequence, start=1):
+        compiled, spec = _compile_node(f"{prefix}{position}", step, previous, loop_vars, ctx)
+        if compiled is not None:
+            nodes.append(compiled)
+        previous = spec
+    return tuple(nodes), previous
+
+
+def _plan_scripts(nodes):
+    """
+    The script paths of every run_script step in a plan, nested steps
+    included.
+    """
+    for node in nodes:
+        if isinstance(node, CompiledLoop):
+            yield from _plan_scripts(node.body)
+        elif isinstance(node, CompiledParallel):
+            for lane in node.lanes:
+                yield from _plan_scripts(child for _, child in lane)
+        elif node.action == "run_script":
+            script = dict(node.params).get("script")
+            if isinstance(script, str):
+                yield script
+
+
+def _rebase_nodes(nodes, directory, params):
+    rebased = []
+    for node in nodes:
+        if isinstance(node, CompiledLoop):
+            node = node._replace(body=_rebase_nodes(node.body, directory, params))
+        elif isinstance(node, CompiledParallel):
+            node = node._replace(lanes=tuple(
+                tuple(zip((key for key, _ in lane), _rebase_nodes([n for _, n in lane], directory, params)))
+                for lane in node.lanes
+            ))
+        else:
+            node = node._replace(params=tuple(
+                (key, os.path.join(directory, value))
+                if key in params and isinstance(value, str) and not os.path.isabs(value)
+                else (key, value)
+                for key, value in node.params
+            ))
+        rebased.append(node)
+    return tuple(rebased)
+
+
+# Step parameters holding a file path: files a step writes, and files it
+# reads.
+OUTPUT_PATH_PARAMS = ("save_to",)
+PATH_PARAMS = OUTPUT_PATH_PARAMS + ("script", "file")
+
+
+def rebase_paths(plan, directory, params=OUTPUT_PATH_PARAMS):
+    """
+    Copy of plan with the relative path parameters named in params
+    (static values only) joined onto directory, e.g. to give every bench
+    its own output files, or to make paths absolute before a plan runs in
+    another process.
+    """
+    return plan._replace(steps=_rebase_nodes(plan.steps, directory, params))
+
+
+def plan_key(cfg, known_instruments=(), source_key=None):
+    """
+    source_key, when given, identifies the routine content (see
+    run_test.routine_key) and saves serialising a large cfg to hash it.
+    """
+    if source_key is None:
+        source_key = json.dumps(cfg, sort_keys=True, default=str)
+    return cache.content_key(
+        PLAN_VERSION,
+        cache.file_key(SCHEMA_PATH),
+        ",".join(sorted(known_instruments)),
+        source_key,
+    )
+
+
+def compile_routine(cfg, known_instruments=None, use_cache=True, source_key=None):
+    """
+    Validate a parsed routine against actions_schema.yaml and turn its
+    sequence into an immutable ExecutionPlan.
+
+    Loop blocks (repeat / foreach / sweep) are compiled into CompiledLoop
+    nodes and are only expanded when the plan runs. Parallel blocks are
+    compiled into CompiledParallel nodes with their steps already grouped
+    into per-instrument lanes.
+
+    All problems are collected and raised together as a RoutineError, so
+    nothing is connected until the whole routine is known to be valid.
+    Valid plans are cached by content hash (together with the schema),
+    so an unchanged routine skips re-validation. The script paths are
+    still checked on a cache hit, since scripts can be removed or renamed
+    without the routine changing; a missing one falls through to a full
+    compile, which reports it.
+    """
+    known = tuple(known_instruments) if known_instruments is not None else ()
+
+    key = plan_key(cfg, known, source_key) if use_cache else None
+    if key is not None:
+        plan = cache.load("plans", key)
+        if plan is not None and all(os.path.isfile(s) for s in _plan_scripts(plan.steps)):
+            return plan
+
+    errors = []
+
+    if not isinstance(cfg, dict):
+        raise RoutineError(["routine must be a mapping with 'instruments' and 'sequence'"])
+
+    instruments = cfg.get("instruments") or {}
+    if not isinstance(instruments, dict):
+        errors.append("'instruments' must be a mapping")
+        instruments = {}
+
+    for name, info in instruments.items():
+        if name == "local":
+            continue
+        if known and name not in known:
+            errors.append(f"instrument '{name}': unknown instrument type")
+        if not isinstance(info, dict) or not info.get("ip"):
+            errors.append(f"instrument '{name}': missing 'ip'")
+        elif "transport" in info:
+            cls = known_instruments.get(name) if isinstance(known_instruments, Mapping) else None
+            supported = getattr(cls, "TRANSPORTS", ()) if cls is not None else TRANSPORTS
+            if info["transport"] not in supported:
+                errors.append(
+                    f"instrument '{name}': transport {info['transport']!r} not supported "
+                    f"(supported: {', '.join(supported) or 'none'})"
+                )
+
+    sequence = cfg.get("sequence")
+    if not isinstance(sequence, list):
+        errors.append("'sequence' must be a list of steps")
+        sequence = []
+
+    ctx = _Context(instruments, errors)
+    steps, _ = _compile_sequence(sequence, None, frozenset(), ctx)
+
+    if errors:
+        raise RoutineError(errors)
+
+    plan = ExecutionPlan(
+        key=key,
+        instruments=tuple(name for name in instruments if name != "local"),
+        steps=steps,
+    )
+
+    if key is not None:
+        cache.store("plans", key, plan)
+
+    return plan
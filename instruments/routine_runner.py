@@ -0,0 +1,379 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import AsyncExitStack, ExitStack
+
+import numpy as np
+
+from instruments.log import Short, get_logger
+from instruments.routine_compiler import LOOP_INFO_KEY, CompiledLoop, CompiledParallel
+from instruments.step_dispatcher import arun_compiled_step, resolve_value, run_compiled_step
+
+log = get_logger("runner")
+
+
+# ----------------------------------------------------------------------
+# Loop values
+# ----------------------------------------------------------------------
+
+def _sweep_values(start, stop, step=None, points=None, spacing="linear"):
+    """
+    Yield sweep points one at a time; stop is included.
+    """
+    if points is not None:
+        if points == 1:
+            yield start
+            return
+        for i in range(points):
+            if spacing == "log":
+                yield start * (stop / start) ** (i / (points - 1))
+            else:
+                yield start + (stop - start) * i / (points - 1)
+        return
+
+    # Small tolerance so e.g. 0 -> 3.3 in steps of 0.1 includes 3.3, and
+    # rounding to 12 significant digits so that point reads 3.3 rather
+    # than 3.3000000000000003. Rounding is relative to the value, so pA
+    # and nA sweeps keep their precision; float noise around a zero
+    # crossing becomes 0.0.
+    count = int(np.floor((stop - start) / step + 1e-9)) + 1
+    for i in range(max(count, 0)):
+        value = start + i * step
+        if abs(value) < abs(step) * 1e-9:
+            yield 0.0
+        else:
+            yield float(f"{value:.12g}")
+
+
+def loop_values(loop, last_result, loop_vars, results=None):
+    """
+    Iterable of values for a CompiledLoop, produced lazily.
+    """
+    spec = dict(loop.spec)
+
+    if loop.kind == "repeat":
+        return range(spec["count"])
+
+    if loop.kind == "foreach":
+        return resolve_value(spec["values"], last_result, loop_vars, results)
+
+    return _sweep_values(
+        spec["start"],
+        spec["stop"],
+        step=spec["step"],
+        points=spec["points"],
+        spacing=spec["spacing"],
+    )
+
+
+# ----------------------------------------------------------------------
+# Result collection
+# ----------------------------------------------------------------------
+
+class LoopResults:
+    """
+    Collects one row per iteration as columns, returned as NumPy arrays.
+
+    Dict results contribute one column per field; other results go into a
+    "result" column. Nested loop results (dicts of arrays) stack into
+    arrays with one extra dimension. Loop metadata is kept apart under
+    LOOP_INFO_KEY, so it never collides with the body's fields.
+    """
+
+    def __init__(self, var):
+        self.var = var
+        self.columns = {}
+        self.rows = 0
+
+    def _column(self, name):
+        column = self.columns.get(name)
+        if column is None:
+            # Fields that first appear late are padded for earlier rows.
+            column = self.columns[name] = [None] * self.rows
+        return column
+
+    def add(self, value, result):
+        if self.var:
+            self._column(self.var).append(value)
+
+        if isinstance(result, dict):
+            fields = result
+        elif result is not None:
+            fields = {"result": result}
+        else:
+            fields = {}
+
+        for name, field in fields.items():
+            # A nested loop's metadata describes that loop, not this one.
+            if name != self.var and name != LOOP_INFO_KEY:
+                self._column(name).append(field)
+
+        self.rows += 1
+        for column in self.columns.values():
+            if len(column) < self.rows:
+                column.append(None)
+
+    def to_dict(self):
+        out = {}
+        for name, column in self.columns.items():
+            try:
+                out[name] = np.asarray(column)
+            except ValueError:
+                # Ragged rows (e.g. captures of different lengths).
+                out[name] = column
+        out[LOOP_INFO_KEY] = {"iterations": self.rows}
+        return out
+
+
+# ----------------------------------------------------------------------
+# Run records
+# ----------------------------------------------------------------------
+
+def _record(recorder, node, start, result, last_result, loop_vars, results, error=None):
+    """
+    Add a finished step to a RunRecorder, with its references resolved.
+    """
+    end = time.time()
+    params = dict(node.params)
+    for key in node.refs:
+        try:
+            params[key] = resolve_value(params[key], last_result, loop_vars, results)
+        except Exception:
+            params[key] = str(params[key])
+    recorder.step(node, params, result, start, end, loop_vars, error)
+
+
+# ----------------------------------------------------------------------
+# Execution
+# ----------------------------------------------------------------------
+
+class RoutineRunner:
+    """
+    Runs the nodes of an ExecutionPlan against connected instruments.
+
+    Results of nodes with an id are kept in self.results (inside a loop
+    the latest iteration wins). Every step holds the locks of the
+    instruments it uses, so steps in parallel lanes never talk to the
+    same instrument at once.
+    """
+
+    def __init__(self, instruments, recorder=None):
+        self.instruments = instruments
+        self.results = {}
+        self.locks = {name: threading.Lock() for name in instruments}
+        self.recorder = recorder
+
+    def run(self, nodes, last_result=None, loop_vars=None):
+        """
+        Run nodes in order and return the last result. A block's result
+        (loop columns or the joined parallel results) becomes $last for
+        the next step.
+        """
+        loop_vars = loop_vars or {}
+
+        for node in nodes:
+            if isinstance(node, CompiledLoop):
+                result = self._run_loop(node, last_result, loop_vars)
+            elif isinstance(node, CompiledParallel):
+                result = self._run_parallel(node, last_result, loop_vars)
+            else:
+                result = self._run_step(node, last_result, loop_vars)
+
+            if node.id is not None:
+                self.results[node.id] = result
+            last_result = result
+
+        return last_result
+
+    def _run_step(self, node, last_result, loop_vars):
+        inst = self.instruments.get(node.instrument)
+        log.info("\nStep %s: %s on %s", node.index, node.action, node.instrument)
+
+        # Sorted acquisition order, so lanes cannot deadlock.
+        with ExitStack() as stack:
+            for name in node.uses:
+                lock = self.locks.get(name)
+                if lock is not None:
+                    stack.enter_context(lock)
+
+            start = time.time()
+            try:
+                result = run_compiled_step(
+                    node, inst, last_result, self.instruments, loop_vars, self.results
+                )
+            except Exception as e:
+                if self.recorder is not None:
+                    _record(self.recorder, node, start, None, last_result, loop_vars, self.results, e)
+                raise
+
+        if self.recorder is not None:
+            _record(self.recorder, node, start, result, last_result, loop_vars, self.results)
+
+        if result is not None:
+            log.info("  Result: %s", Short(result))
+        return result
+
+    def _run_loop(self, loop, last_result, loop_vars):
+        collected = LoopResults(loop.var)
+
+        for value in loop_values(loop, last_result, loop_vars, self.results):
+            inner_vars = dict(loop_vars)
+            if loop.var:
+                inner_vars[loop.var] = value
+
+            log.info("\n[%s %s] %s = %s", loop.kind, loop.index, loop.var, Short(value))
+            last_result = self.run(loop.body, last_result, inner_vars)
+            collected.add(value, last_result)
+
+        return collected.to_dict()
+
+    def _run_lane(self, lane, last_result, loop_vars):
+        # Every child sees the result from before the block as $last,
+        # whichever lane it was grouped into.
+        return {
+            key: self.run((node,), last_result, loop_vars)
+            for key, node in lane
+        }
+
+    def _run_parallel(self, block, last_result, loop_vars):
+        """
+        Run each lane on its own worker thread and join the results into a
+        dict keyed by step id (or "<action>_<position>"). If a lane fails,
+        the other lanes still finish before the first error is raised.
+        """
+        log.info("\n[parallel %s] %d lane(s)", block.index, len(block.lanes))
+
+        if len(block.lanes) == 1:
+            joined = self._run_lane(block.lanes[0], last_result, loop_vars)
+            return {key: joined[key] for key in block.keys}
+
+        with ThreadPoolExecutor(max_workers=len(block.lanes)) as pool:
+            futures = [
+                pool.submit(self._run_lane, lane, last_result, loop_vars)
+                for lane in block.lanes
+            ]
+            wait(futures)
+
+        joined = {}
+        for future in futures:
+            joined.update(future.result())
+
+        # Report in routine order rather than lane order.
+        return {key: joined[key] for key in block.keys}
+
+
+class AsyncRoutineRunner:
+    """
+    asyncio counterpart of RoutineRunner: one event loop drives every
+    instrument. Steps whose driver has an async variant run on the loop
+    without a thread; the rest run in worker threads. Parallel lanes are
+    tasks, and instrument locks are asyncio locks.
+    """
+
+    def __init__(self, instruments, recorder=None):
+        self.instruments = instruments
+        self.results = {}
+        self.locks = {name: asyncio.Lock() for name in instruments}
+        self.recorder = recorder
+
+    async def run(self, nodes, last_result=None, loop_vars=None):
+        loop_vars = loop_vars or {}
+
+        for node in nodes:
+            if isinstance(node, CompiledLoop):
+                result = await self._run_loop(node, last_result, loop_vars)
+            elif isinstance(node, CompiledParallel):
+                result = await self._run_parallel(node, last_result, loop_vars)
+            else:
+                result = await self._run_step(node, last_result, loop_vars)
+
+            if node.id is not None:
+                self.results[node.id] = result
+            last_result = result
+
+        return last_result
+
+    async def _run_step(self, node, last_result, loop_vars):
+        inst = self.instruments.get(node.instrument)
+        log.info("\nStep %s: %s on %s", node.index, node.action, node.instrument)
+
+        async with AsyncExitStack() as stack:
+            for name in node.uses:
+                lock = self.locks.get(name)
+                if lock is not None:
+                    await stack.enter_async_context(lock)
+
+            start = time.time()
+            try:
+                result = await arun_compiled_step(
+                    node, inst, last_result, self.instruments, loop_vars, self.results
+                )
+            except Exception as e:
+                if self.recorder is not None:
+                    _record(self.recorder, node, start, None, last_result, loop_vars, self.results, e)
+                raise
+
+        if self.recorder is not None:
+            _record(self.recorder, node, start, result, last_result, loop_vars, self.results)
+
+        if result is not None:
+            log.info("  Result: %s", Short(result))
+        return result
+
+    async def _run_loop(self, loop, last_result, loop_vars):
+        collected = LoopResults(loop.var)
+
+        for value in loop_values(loop, last_result, loop_vars, self.results):
+            inner_vars = dict(loop_vars)
+            if loop.var:
+                inner_vars[loop.var] = value
+
+            log.info("\n[%s %s] %s = %s", loop.kind, loop.index, loop.var, Short(value))
+            last_result = await self.run(loop.body, last_result, inner_vars)
+            collected.add(value, last_result)
+
+        return collected.to_dict()
+
+    async def _run_lane(self, lane, last_result, loop_vars):
+        out = {}
+        for key, node in lane:
+            out[key] = await self.run((node,), last_result, loop_vars)
+        return out
+
+    async def _run_parallel(self, block, last_result, loop_vars):
+        log.info("\n[parallel %s] %d lane(s)", block.index, len(block.lanes))
+
+        outcomes = await asyncio.gather(
+            *(self._run_lane(lane, last_result, loop_vars) for lane in block.lanes),
+            return_exceptions=True,
+        )
+
+        joined = {}
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException):
+                raise outcome
+            joined.update(outcome)
+
+        return {key: joined[key] for key in block.keys}
+
+
+def run_plan(plan, instruments, recorder=None):
+    """
+    Execute an ExecutionPlan against connected instruments. Returns the
+    results table: step id -> result. Executed steps are added to
+    recorder (a results_store.RunRecorder) when one is given.
+    """
+    runner = RoutineRunner(instruments, recorder)
+    runner.run(plan.steps)
+    return runner.results
+
+
+async def run_plan_async(plan, instruments, recorder=None):
+    """
+    Execute an ExecutionPlan on the running event loop. Returns the
+    results table: step id -> result.
+    """
+    runner = AsyncRoutineRunner(instruments, recorder)
+    await runner.run(plan.steps)
+    return runner.results
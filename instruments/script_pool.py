@@ -0,0 +1,164 @@
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Worker processes for run_script steps with background: true.
+SCRIPT_WORKERS = int(os.environ.get("TESTBENCH_SCRIPT_WORKERS", "0")) or max(1, (os.cpu_count() or 2) - 1)
+
+# Arrays smaller than this are pickled; larger ones go through shared memory.
+SHARED_MEMORY_MIN_BYTES = 64 * 1024
+
+_lock = threading.Lock()
+_executor = None
+
+
+class _SharedArray:
+    """
+    Picklable stand-in for a NumPy array held in a shared memory block.
+    """
+
+    def __init__(self, name, shape, dtype):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+
+
+# ----------------------------------------------------------------------
+# Parent side
+# ----------------------------------------------------------------------
+
+def _rebuild(value, items):
+    # namedtuples take their fields as separate arguments.
+    if hasattr(type(value), "_fields"):
+        return type(value)(*items)
+    return type(value)(items)
+
+
+def _resolve(value):
+    """
+    Replace Futures of earlier background scripts in value by their
+    results, waiting for them. Only applied to what the script reads.
+    """
+    if isinstance(value, Future):
+        return _resolve(value.result())
+    if isinstance(value, dict):
+        return {k: _resolve(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return _rebuild(value, [_resolve(v) for v in value])
+    return value
+
+
+def _share(value, blocks):
+    """
+    Copy large arrays in value into shared memory blocks (appended to
+    blocks) and replace them with _SharedArray descriptors.
+    """
+    if isinstance(value, np.ndarray):
+        if value.nbytes < SHARED_MEMORY_MIN_BYTES or value.dtype.hasobject:
+            return value
+        block = shared_memory.SharedMemory(create=True, size=value.nbytes)
+        blocks.append(block)
+        np.ndarray(value.shape, value.dtype, buffer=block.buf)[...] = value
+        return _SharedArray(block.name, value.shape, value.dtype.str)
+
+    if isinstance(value, dict):
+        return {k: _share(v, blocks) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return _rebuild(value, [_share(v, blocks) for v in value])
+    return value
+
+
+def _release(blocks):
+    for block in blocks:
+        block.close()
+        block.unlink()
+
+
+def executor():
+    """
+    The persistent process pool, started on first use. Workers are spawned
+    so they never inherit open instrument sessions.
+    """
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=SCRIPT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def submit(script, input_data, steps):
+    """
+    Run a script in the pool. Returns a concurrent.futures.Future of its
+    output; the shared memory used for the inputs is freed when it
+    completes. steps should hold only the results the script reads: any
+    Futures in input_data or steps are waited for.
+    """
+    blocks = []
+    try:
+        payload = _share(_resolve({"input_data": input_data, "steps": steps}), blocks)
+        future = executor().submit(_run_in_worker, script, payload)
+    except BaseException:
+        _release(blocks)
+        raise
+    future.add_done_callback(lambda _: _release(blocks))
+    return future
+
+
+def shutdown():
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True, cancel_futures=True)
+            _executor = None
+
+
+atexit.register(shutdown)
+
+
+# ----------------------------------------------------------------------
+# Worker side
+# ----------------------------------------------------------------------
+
+def _attach(value, blocks):
+    if isinstance(value, _SharedArray):
+        block = shared_memory.SharedMemory(name=value.name)
+        blocks.append(block)
+        return np.ndarray(value.shape, np.dtype(value.dtype), buffer=block.buf)
+    if isinstance(value, dict):
+        return {k: _attach(v, blocks) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return _rebuild(value, [_attach(v, blocks) for v in value])
+    return value
+
+
+def _detach(value):
+    # Output arrays that are views of shared input memory must be copied
+    # before the blocks are closed.
+    if isinstance(value, np.ndarray) and not value.flags.owndata:
+        return value.copy()
+    if isinstance(value, dict):
+        return {k: _detach(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return _rebuild(value, [_detach(v) for v in value])
+    return value
+
+
+def _run_in_worker(script, payload):
+    from instruments.step_dispatcher import run_script_file
+
+    blocks = []
+    try:
+        inputs = _attach(payload, blocks)
+        output = run_script_file(script, inputs["input_data"], inputs["steps"])
+        return _detach(output)
+    finally:
+        for block in blocks:
+            block.close()
@@ -1,5 +1,24 @@
+import os
+import re
 import time
-import runpy
+import ast
+import asyncio
+import inspect
+import logging
+import weakref
+from collections import namedtuple
+from concurrent.futures import Future
+
+import yaml
+
+from instruments import profiler
+from instruments.log import Short, get_logger
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCHEMA_PATH = os.path.join(BASE_DIR, "actions_schema.yaml")
+
+log = get_logger("dispatcher")
+
 
 def coerce_type(value, expected_type):
     if value is None:
@@ -22,7 +41,8 @@ def coerce_type(value, expected_type):
         return str(value)
 
     if expected_type == "list":
-        if isinstance(value, list):
+        # Tuples and NumPy arrays are passed through unchanged.
+        if isinstance(value, (list, tuple)) or hasattr(value, "__array__"):
             return value
         return [value]
 
@@ -31,276 +51,585 @@ def coerce_type(value, expected_type):
             return value
         raise TypeError(f"Expected dict, got {type(value)}")
 
+    if expected_type == "instrument":
+        # Resolved against the connected instruments at call time.
+        return str(value)
+
     raise ValueError(f"Unsupported type in schema: {expected_type}")
 
 
-def execute_step(step, inst, last_result):
-    if "delay_before" in step:
-        time.sleep(step["delay_before"])
+# ----------------------------------------------------------------------
+# Action table
+# ----------------------------------------------------------------------
+
+class ActionSpec:
+    """
+    One schema action compiled for dispatch: the driver method (or
+    registered handler) to call and how to bind step keys to arguments.
+    """
+
+    def __init__(self, name, instrument, method=None, params=None, handler=None, returns=None):
+        self.name = name
+        self.instrument = instrument
+        self.method = method
+        self.handler = handler
+        self.params = dict(params or {})
+        self.returns = returns or {}
+        # (step key, argument name, type, required, has_default, default)
+        self.binding = tuple(
+            (
+                key,
+                info.get("arg", key),
+                info.get("type"),
+                bool(info.get("required", False)),
+                "default" in info,
+                info.get("default"),
+            )
+            for key, info in self.params.items()
+        )
+        self._bound = weakref.WeakKeyDictionary()
+
+    def bind(self, step, instruments=None):
+        """
+        Build the keyword arguments for a resolved step, applying schema
+        defaults and type coercion.
+        """
+        kwargs = {}
+        for key, arg, ptype, required, has_default, default in self.binding:
+            if key in step:
+                value = step[key]
+            elif required:
+                raise ValueError(f"{self.name} requires '{key}'")
+            elif has_default:
+                value = default
+            else:
+                continue
+
+            if ptype:
+                try:
+                    value = coerce_type(value, ptype)
+                except (TypeError, ValueError) as e:
+                    raise ValueError(
+                        f"{self.name}: invalid value for '{key}': {e}"
+                    ) from e
+
+            if ptype == "instrument" and value is not None:
+                if not instruments or value not in instruments:
+                    raise ValueError(
+                        f"{self.name}: instrument '{value}' is not connected"
+                    )
+                value = instruments[value]
+
+            kwargs[arg] = value
+        return kwargs
+
+    def bound_method(self, inst):
+        if inst is None:
+            raise ValueError(
+                f"{self.name} requires a connected '{self.instrument}' instrument"
+            )
+        try:
+            return self._bound[inst]
+        except KeyError:
+            method = getattr(inst, self.method)
+            self._bound[inst] = method
+            return method
+        except TypeError:
+            # Not weak-referenceable; look the method up each time.
+            return getattr(inst, self.method)
+
+    def call(self, inst, kwargs, context):
+        if self.handler is not None:
+            return self.handler(inst, context, **kwargs)
+        return self.bound_method(inst)(**kwargs)
+
+    async def acall(self, inst, kwargs, context):
+        """
+        Async dispatch: await the driver's `<method>_async` coroutine if it
+        has one (or the method itself if it is a coroutine), otherwise run
+        the sync method in a worker thread.
+        """
+        if self.handler is not None:
+            if inspect.iscoroutinefunction(self.handler):
+                return await self.handler(inst, context, **kwargs)
+            return await asyncio.to_thread(self.handler, inst, context, **kwargs)
+
+        method = self.bound_method(inst)
+        if inspect.iscoroutinefunction(method):
+            return await method(**kwargs)
+
+        async_method = getattr(inst, f"{self.method}_async", None)
+        if async_method is not None and inspect.iscoroutinefunction(async_method):
+            return await async_method(**kwargs)
+
+        return await asyncio.to_thread(method, **kwargs)
+
+
+ACTION_HANDLERS = {}
+
+_ACTION_TABLE = None
+
+
+def register_action(name, handler, instrument="local", params=None):
+    """
+    Register a Python handler for an action that is not a plain driver
+    method. The handler is called as handler(inst, context, **kwargs),
+    where context holds "last_result" and "instruments".
+
+    Parameters come from actions_schema.yaml when the action is listed
+    there, otherwise from `params` (same format as the schema).
+    """
+    global _ACTION_TABLE
+    ACTION_HANDLERS[name] = (handler, instrument, params)
+    # Rebuild on next use so the new action is picked up.
+    _ACTION_TABLE = None
+
+
+def _add_handler_spec(table, name, schema_actions):
+    handler, instrument, params = ACTION_HANDLERS[name]
+    entry = schema_actions.get(name, {})
+    table[name] = ActionSpec(
+        name,
+        entry.get("instrument", instrument),
+        params=entry.get("parameters", params),
+        handler=handler,
+        returns=entry.get("returns"),
+    )
+
+
+def build_action_table(schema_path=SCHEMA_PATH):
+    with open(schema_path, "r") as f:
+        schema = yaml.safe_load(f)
+
+    actions = schema.get("actions", {})
+    table = {}
+
+    for name, entry in actions.items():
+        if name in ACTION_HANDLERS:
+            continue
+        if "method" not in entry:
+            raise ValueError(f"Schema action '{name}' has no method")
+        table[name] = ActionSpec(
+            name,
+            entry.get("instrument"),
+            method=entry["method"],
+            params=entry.get("parameters"),
+            returns=entry.get("returns"),
+        )
 
-    action = step["action"]
-    print(f"[DEBUG] action={step['action']} last_result={last_result!r} ({type(last_result)})")
+    for name in ACTION_HANDLERS:
+        _add_handler_spec(table, name, actions)
 
-    result = None
+    return table
 
-    resolved_step = {}
 
-    for key, value in step.items():
+def get_action_table():
+    """
+    Action name -> ActionSpec, built from the schema on first use.
+    """
+    global _ACTION_TABLE
+    if _ACTION_TABLE is None:
+        _ACTION_TABLE = build_action_table()
+    return _ACTION_TABLE
 
-        if value == "$last":
-            if last_result is None:
-                raise ValueError("No last_result available")
-            resolved_step[key] = last_result
-            continue
 
-        if isinstance(value, str) and value.startswith("$last."):
-            if last_result is None:
-                raise ValueError("No last_result available")
-            if not isinstance(last_result, dict):
-                raise TypeError(
-                    f"$last is not a dict, cannot access field in {value}"
-                )
-            field = value[len("$last."):]
-            resolved_step[key] = last_result[field]
+def get_action(action):
+    spec = get_action_table().get(action)
+    if spec is None:
+        raise ValueError(f"Unknown action: {action}")
+    return spec
+
+
+# ----------------------------------------------------------------------
+# Local actions
+# ----------------------------------------------------------------------
+
+# Script path -> _Script, reloaded when the file's mtime changes.
+_SCRIPTS = {}
+
+_Script = namedtuple("_Script", ["mtime", "code", "entry"])
+
+
+def _has_entry_point(tree):
+    return any(
+        isinstance(node, ast.FunctionDef) and node.name == "run"
+        for node in tree.body
+    )
+
+
+def _load_script(script):
+    """
+    Compile a script once per modification. Scripts that define
+    run(input_data[, steps]) are also executed once here, and the
+    function is kept so later calls skip the module body entirely.
+    """
+    path = os.path.abspath(script)
+    mtime = os.stat(path).st_mtime_ns
+
+    cached = _SCRIPTS.get(path)
+    if cached is not None and cached.mtime == mtime:
+        return cached
+
+    with open(path, "rb") as f:
+        source = f.read()
+    tree = ast.parse(source, path)
+    code = compile(tree, path, "exec")
+
+    entry = None
+    if _has_entry_point(tree):
+        namespace = {"__name__": "<run_path>", "__file__": path}
+        exec(code, namespace)
+        entry = namespace["run"]
+        if len(inspect.signature(entry).parameters) < 2:
+            run_one = entry
+            entry = lambda input_data, steps: run_one(input_data)
+
+    cached = _SCRIPTS[path] = _Script(mtime, code, entry)
+    return cached
+
+
+# Script path -> (mtime, ids), see _script_step_ids.
+_SCRIPT_STEP_IDS = {}
+
+
+def _script_step_ids(script):
+    """
+    The step ids a script reads as steps["<id>"] or steps.get("<id>"),
+    or None when it uses steps in any other way (iterates it, indexes it
+    with a variable, passes it on) and so may need all of it.
+    """
+    path = os.path.abspath(script)
+    mtime = os.stat(path).st_mtime_ns
+    cached = _SCRIPT_STEP_IDS.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    with open(path, "rb") as f:
+        tree = ast.parse(f.read(), path)
+
+    ids = set()
+    allowed = set()  # id() of the steps Name nodes used with a constant key
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Subscript):
+            target, key = node.value, node.slice
+        elif (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Attribute)
+            and node.func.attr == "get"
+            and node.args
+        ):
+            target, key = node.func.value, node.args[0]
+        else:
             continue
+        if isinstance(target, ast.Name) and target.id == "steps" and isinstance(key, ast.Constant):
+            ids.add(key.value)
+            allowed.add(id(target))
+
+    dynamic = any(
+        isinstance(node, ast.Name) and node.id == "steps" and id(node) not in allowed
+        and not isinstance(node.ctx, ast.Store)
+        for node in ast.walk(tree)
+    )
+    result = None if dynamic else frozenset(ids)
+    _SCRIPT_STEP_IDS[path] = (mtime, result)
+    return result
 
-        if isinstance(value, list):
-            resolved_list = []
-            for v in value:
-                if v == "$last":
-                    if last_result is None:
-                        raise ValueError("No last_result available")
-                    resolved_list.append(last_result)
-
-                elif isinstance(v, str) and v.startswith("$last."):
-                    if last_result is None:
-                        raise ValueError("No last_result available")
-                    if not isinstance(last_result, dict):
-                        raise TypeError(
-                            f"$last is not a dict, cannot access field in {v}"
-                        )
-                    field = v[len("$last."):]
-                    resolved_list.append(last_result[field])
-
-                else:
-                    resolved_list.append(v)
-
-            resolved_step[key] = resolved_list
-            continue
 
-        resolved_step[key] = value
+def run_script_file(script, input_data, steps):
+    """
+    Function-style scripts return their output from run(); module-style
+    scripts read the globals input_data / steps and set OUTPUT.
+    """
+    loaded = _load_script(script)
 
-    step = resolved_step
+    if loaded.entry is not None:
+        return loaded.entry(input_data, steps)
 
+    globals_dict = {
+        "__name__": "<run_path>",
+        "__file__": os.path.abspath(script),
+        "input_data": input_data,
+        "steps": steps,
+    }
+    exec(loaded.code, globals_dict)
+    return globals_dict.get("OUTPUT")
 
-    # ------------------------------------------------------------------
-    # KEYSIGHT E36312 ACTIONS
-    # ------------------------------------------------------------------
 
-    if action == "psu_configure":
-        result = inst.configure_psu(
-            channel=step["channel"],
-            current_limit=step.get("current_limit"),
-            voltage_limit=step.get("voltage_limit"),
-            output_enabled=step.get("output_enabled", False),
-            sense_mode=step.get("sense_mode", "local"),
-        )
+def _run_script(inst, context, script, background=False):
+    input_data = context["last_result"]
+    steps = context.get("results", {})
+
+    if background:
+        # Runs in the script process pool; the step's result is a Future
+        # for a later await_script step. Only the results the script reads
+        # are shipped; results of other background scripts still running
+        # are left out rather than waited for.
+        from instruments import script_pool
+
+        ids = _script_step_ids(script)
+        if ids is None:
+            steps = {k: v for k, v in steps.items() if not isinstance(v, Future)}
+        else:
+            steps = {k: v for k, v in steps.items() if k in ids}
+        return script_pool.submit(script, input_data, steps)
+
+    return run_script_file(script, input_data, steps)
 
-    elif action == "psu_set_power":
-        result = inst.set_power(
-            ch=step["channel"],
-            voltage=step["voltage"],
-            current_limit=step["current_limit"],
-            ramp_time=step.get("ramp_time", 0.0),
-        )
 
-    elif action == "psu_ramp_voltage":
-        result = inst.ramp_voltage(
-            ch=step["channel"],
-            target_voltage=step["target_voltage"],
-            ramp_time=step["ramp_time"],
+def _await_script(inst, context, future, timeout=None):
+    if not isinstance(future, Future):
+        raise ValueError(
+            "await_script: 'future' must reference a run_script step with background: true"
         )
+    return future.result(timeout=timeout)
 
-    elif action == "psu_measure_voltage":
-        result = inst.measure_voltage(step["channel"])
 
-    elif action == "psu_measure_current":
-        result = inst.measure_current(step["channel"])
+register_action("run_script", _run_script)
+register_action("await_script", _await_script)
 
-    elif action == "psu_measure_power":
-        result = inst.measure_power(step["channel"])
 
-    # ------------------------------------------------------------------
-    # KEITHLEY 2450 SMU ACTIONS
-    # ------------------------------------------------------------------
+# ----------------------------------------------------------------------
+# References to earlier results
+# ----------------------------------------------------------------------
 
-    elif action == "smu_reset":
-        result = inst.smu_reset()
+# A parsed "$last...", "$steps.<id>..." or "$loop.<var>..." reference.
+# path holds the field names (str) and indexes (int) to apply in order.
+Ref = namedtuple("Ref", ["source", "name", "path", "text"])
 
-    elif action == "smu_zero_output":
-        result = inst.smu_zero_output()
+_REF_HEAD = re.compile(r"\$(last|steps|loop)\b")
+_REF_PART = re.compile(r"\.([^.\[\]]+)|\[(-?\d+)\]")
 
-    elif action == "smu_configure":
-        result = inst.smu_configure(
-            source_function=step["source_function"],
-            source_level=step["source_level"],
-            compliance_limit=step["compliance_limit"],
-            measure_function=step["measure_function"],
-            sense_mode=step.get("sense_mode", "2w"),
-            output_enabled=step.get("output_enabled", False),
-        )
 
-    elif action == "smu_set_source":
-        result = inst.smu_set_source(
-            source_function=step["source_function"],
-            level=step["level"],
-            compliance_limit=step["compliance_limit"],
-            output_enabled=step.get("output_enabled", True),
-        )
+def parse_ref(text):
+    """
+    Parse a reference string into a Ref, or return None if text is not a
+    reference. Raises ValueError for a malformed reference.
 
-    elif action == "smu_set_output":
-        result = inst.smu_set_output(
-            enabled=step["enabled"]
-        )
+        $last, $last.field, $last.field[0].sub
+        $steps.<id>, $steps.<id>.field[2]
+        $loop.<var>
+    """
+    if not isinstance(text, str) or not text.startswith("$"):
+        return None
+    head = _REF_HEAD.match(text)
+    if head is None:
+        return None
 
-    elif action == "smu_measure_voltage":
-        result = inst.smu_measure_voltage()
+    source = head.group(1)
+    path = []
+    pos = head.end()
+    while pos < len(text):
+        part = _REF_PART.match(text, pos)
+        if part is None:
+            raise ValueError(f"Malformed reference: {text}")
+        path.append(part.group(1) if part.group(1) is not None else int(part.group(2)))
+        pos = part.end()
+
+    name = None
+    if source != "last":
+        if not path or not isinstance(path[0], str):
+            raise ValueError(f"Malformed reference: {text} (expected ${source}.<name>)")
+        name = path.pop(0)
+
+    return Ref(source, name, tuple(path), text)
+
+
+def compile_refs(value, refs=None):
+    """
+    Return value with every reference string (also inside lists and
+    dicts) replaced by its Ref. Found Refs are appended to refs if given.
+    """
+    if isinstance(value, str):
+        ref = parse_ref(value)
+        if ref is None:
+            return value
+        if refs is not None:
+            refs.append(ref)
+        return ref
+    if isinstance(value, list):
+        return [compile_refs(v, refs) for v in value]
+    if isinstance(value, dict):
+        return {k: compile_refs(v, refs) for k, v in value.items()}
+    return value
+
+
+def evaluate_ref(ref, last_result, loop_vars=None, results=None):
+    if ref.source == "last":
+        if last_result is None:
+            raise ValueError("No last_result available")
+        value = last_result
+    elif ref.source == "loop":
+        if not loop_vars or ref.name not in loop_vars:
+            raise ValueError(f"{ref.text} used outside a loop defining it")
+        value = loop_vars[ref.name]
+    else:
+        if not results or ref.name not in results:
+            raise ValueError(f"{ref.text}: step '{ref.name}' has no result yet")
+        value = results[ref.name]
+
+    for part in ref.path:
+        try:
+            value = value[part]
+        except (KeyError, IndexError, TypeError) as e:
+            raise ValueError(
+                f"{ref.text}: cannot access {part!r} in {type(value).__name__}"
+            ) from e
+    return value
+
+
+def resolve_value(value, last_result, loop_vars=None, results=None):
+    """
+    Replace the Refs in an already compiled value with their results.
+    """
+    if isinstance(value, Ref):
+        return evaluate_ref(value, last_result, loop_vars, results)
+    if isinstance(value, list):
+        return [resolve_value(v, last_result, loop_vars, results) for v in value]
+    if isinstance(value, dict):
+        return {
+            k: resolve_value(v, last_result, loop_vars, results)
+            for k, v in value.items()
+        }
+    return value
 
-    elif action == "smu_measure_current":
-        result = inst.smu_measure_current()
 
-    elif action == "smu_sweep":
-        result = inst.smu_sweep(
-            start=step["start"],
-            stop=step["stop"],
-            step=step["step"],
-            delay=step.get("delay", 0.0),
-            save_to=step.get("save_to"),
-        )
+def resolve_ref(value, last_result, loop_vars=None, results=None):
+    """
+    Resolve reference strings in a raw step value.
+    """
+    return resolve_value(compile_refs(value), last_result, loop_vars, results)
 
-    # ------------------------------------------------------------------
-    # RIGOL DG1062Z ACTIONS
-    # ------------------------------------------------------------------
 
-    elif action == "wavegen_start_waveform":
-        result = inst.start_waveform(
-            channel=step["channel"],
-            waveform=step["waveform"],
-            output=step.get("output"),
-        )
+# ----------------------------------------------------------------------
+# Step execution
+# ----------------------------------------------------------------------
 
-    elif action == "wavegen_configure_output":
-        result = inst.configure_output(
-            channel=step["channel"],
-            impedance=step.get("impedance"),
-            enabled=step.get("enabled"),
-        )
+def _sleep(seconds, timing=None):
+    time.sleep(seconds)
+    profiler.add_sleep(timing, seconds)
 
-    elif action == "wavegen_stop_waveform":
-        result = inst.configure_output(
-            channel=step["channel"],
-            enabled=False,
-        )
 
-    # ------------------------------------------------------------------
-    # TEKTRONIX MSO58 ACTIONS
-    # ------------------------------------------------------------------
+def _context(last_result, instruments, results):
+    return {
+        "last_result": last_result,
+        "instruments": instruments,
+        "results": results if results is not None else {},
+    }
 
-    elif action == "scope_configure":
-        result = inst.configure_scope(
-            trigger=step["trigger"],
-            channels=step["channels"],
-            timebase=step["timebase"],
-            measurements=step["measurements"]
-        )
 
-    elif action == "scope_capture":
-        result = inst.capture(
-            channels=step["channels"],
-            duration=step["duration"],
-            save_to=step["save_to"],
-            show_plot=step.get("show_plot",False)
-        )
+def _dispatch(spec, step, inst, last_result, instruments, results=None):
+    kwargs = spec.bind(step, instruments)
+    return spec.call(inst, kwargs, _context(last_result, instruments, results))
 
-    elif action == "scope_screenshot":
-        result = inst.screenshot(
-            save_to=step["save_to"]
-        )
 
-    #----------------------------------------------------------------
-    # NI VIRTUALBENCH ACTIONS
-    #---------------------------------------------------------------- 
+def execute_step(step, inst, last_result, instruments=None, results=None):
+    """
+    Run one raw step dict from a routine's sequence.
+    """
+    prof = profiler.ACTIVE
+    if prof is None:
+        return _execute_step(step, inst, last_result, instruments, results, None)
 
-    elif action == "vb_psu_configure":
-        result = inst.vb_psu_configure(
-            channel=step["channel"],
-            voltage=step.get("voltage"),
-            current_limit=step.get("current_limit"),
-            output_enabled=step.get("output_enabled", False),
-        )
+    timing = prof.begin_step(step["action"], step.get("instrument"))
+    try:
+        return _execute_step(step, inst, last_result, instruments, results, timing)
+    finally:
+        prof.end_step(timing)
 
-    elif action == "vb_psu_set_power":
-        result = inst.vb_psu_set_power(
-            channel=step["channel"],
-            voltage=step["voltage"],
-            current_limit=step["current_limit"],
-        )
 
-    elif action == "vb_psu_enable":
-        result = inst.vb_psu_enable(
-            channel=step["channel"],
-            enable=step.get("enable", True),
-        )
+def _execute_step(step, inst, last_result, instruments, results, timing):
+    if "delay_before" in step:
+        _sleep(step["delay_before"], timing)
 
-    # ---------------- Waveform Generator ----------------
+    action = step["action"]
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("action=%s last_result=%s (%s)", action, Short(last_result), type(last_result).__name__)
 
-    elif action == "vb_wavegen_start_waveform":
-        result = inst.vb_wavegen_start_waveform(
-            waveform=step["waveform"],
-            output=step.get("output"),
-        )
+    spec = get_action(action)
 
-    elif action == "vb_wavegen_stop_waveform":
-        result = inst.vb_wavegen_stop_waveform()
+    step = {
+        key: resolve_ref(value, last_result, results=results)
+        for key, value in step.items()
+    }
 
-    # ---------------- Digital IO ----------------
+    result = _dispatch(spec, step, inst, last_result, instruments, results)
 
-    elif action == "vb_dio_configure":
-        result = inst.vb_dio_configure(
-            lines=step["lines"],
-            direction=step["direction"],
-        )
+    if "delay_after" in step:
+        _sleep(step["delay_after"], timing)
 
-    elif action == "vb_dio_write":
-        result = inst.vb_dio_write(
-            lines=step["lines"],
-            values=step["values"],
-        )
+    return result
 
-    elif action == "vb_dio_read":
-        result = inst.vb_dio_read(
-            lines=step["lines"]
-        )
 
-    # ------------------------------------------------------------------
-    # SCRIPT ACTION
-    # ------------------------------------------------------------------
+def run_compiled_step(cstep, inst, last_result, instruments=None, loop_vars=None, results=None):
+    """
+    Run one CompiledStep from an ExecutionPlan. Parameters were validated
+    at compile time and their references parsed into Refs; only the keys
+    listed in cstep.refs need resolving. loop_vars maps the enclosing loop
+    variables to their current values, results maps step ids to results.
+    """
+    prof = profiler.ACTIVE
+    if prof is None:
+        return _run_compiled_step(cstep, inst, last_result, instruments, loop_vars, results, None)
 
-    elif action == "run_script":
-        if "script" not in step:
-            raise ValueError("run_script requires 'script'")
+    timing = prof.begin_step(cstep.action, cstep.instrument)
+    try:
+        return _run_compiled_step(cstep, inst, last_result, instruments, loop_vars, results, timing)
+    finally:
+        prof.end_step(timing)
 
-        globals_dict = {
-            "input_data": last_result,
-        }
 
-        result = runpy.run_path(step["script"], init_globals=globals_dict)
-        result = result.get("OUTPUT")
+def _run_compiled_step(cstep, inst, last_result, instruments, loop_vars, results, timing):
+    if cstep.delay_before:
+        _sleep(cstep.delay_before, timing)
 
-    else:
-        raise ValueError(f"Unknown action: {action}")
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("action=%s last_result=%s (%s)", cstep.action, Short(last_result), type(last_result).__name__)
 
-    if "delay_after" in step:
-        time.sleep(step["delay_after"])
+    spec = get_action(cstep.action)
+
+    step = dict(cstep.params)
+    for key in cstep.refs:
+        step[key] = resolve_value(step[key], last_result, loop_vars, results)
+
+    result = _dispatch(spec, step, inst, last_result, instruments, results)
+
+    if cstep.delay_after:
+        _sleep(cstep.delay_after, timing)
+
+    return result
+
+
+async def arun_compiled_step(cstep, inst, last_result, instruments=None, loop_vars=None, results=None):
+    """
+    asyncio counterpart of run_compiled_step; delays do not block the loop.
+    """
+    prof = profiler.ACTIVE
+    if prof is None:
+        return await _arun_compiled_step(cstep, inst, last_result, instruments, loop_vars, results, None)
+
+    timing = prof.begin_step(cstep.action, cstep.instrument)
+    try:
+        return await _arun_compiled_step(cstep, inst, last_result, instruments, loop_vars, results, timing)
+    finally:
+        prof.end_step(timing)
+
+
+async def _arun_compiled_step(cstep, inst, last_result, instruments, loop_vars, results, timing):
+    if cstep.delay_before:
+        await asyncio.sleep(cstep.delay_before)
+        profiler.add_sleep(timing, cstep.delay_before)
+
+    spec = get_action(cstep.action)
+
+    step = dict(cstep.params)
+    for key in cstep.refs:
+        step[key] = resolve_value(step[key], last_result, loop_vars, results)
+
+    kwargs = spec.bind(step, instruments)
+    result = await spec.acall(inst, kwargs, _context(last_result, instruments, results))
+
+    if cstep.delay_after:
+        await asyncio.sleep(cstep.delay_after)
+        profiler.add_sleep(timing, cstep.delay_after)
 
     return result
@@ -1,31 +1,68 @@
-from tm_devices import DeviceManager
-import pyvisa
 import numpy as np
 import time
-import pandas as pd
-import matplotlib.pyplot as plt
+
+from instruments import profiler, visa_pool
+from instruments.async_scpi import SCPI_SOCKET_PORT
+from instruments.frequency_response import frequency_response
+from instruments.log import get_logger
+from instruments.transports import (
+    DEFAULT_TRANSPORT,
+    TRANSPORTS,
+    resource_options,
+    resource_string,
+)
+from instruments.waveform_io import save_waveforms
+
+log = get_logger("tektronix_mso58")
+
+# tm_devices connection settings for each transport.
+TM_DEVICES_CONNECTIONS = {
+    "vxi11": {"connection_type": "TCPIP"},
+    "socket": {"connection_type": "SOCKET", "port": SCPI_SOCKET_PORT},
+    "hislip": {"connection_type": "TCPIP", "lan_device_endpoint": "hislip0"},
+}
 
 class TekMSO58:
     """
     TekMSO58 driver implemented using tm_devices.
     
     """
+    TRANSPORTS = TRANSPORTS
 
-    def __init__(self, address, alias="SCOPE1"):
+    def __init__(self, address, alias="SCOPE1", transport=DEFAULT_TRANSPORT):
+        if transport not in self.TRANSPORTS:
+            raise ValueError(f"Unsupported transport: {transport}")
         self.address = address
         self.alias = alias
+        self.transport = transport
         self.dm = None
         self.scope = None
 
     def connect(self):
-        print(f"Connecting to Tektronix MSO58 at {self.address}...")
-
-        self.preclean_visa_buffer()
-
-        self.dm = DeviceManager()
-        self.scope = self.dm.add_scope(self.address, alias=self.alias)
+        log.info("Connecting to Tektronix MSO58 at %s (%s)...", self.address, self.transport)
+
+        self.dm = visa_pool.device_manager()
+        self._pool_key = ("tm_devices", self.address, self.transport)
+        self.scope = visa_pool.acquire(
+            self._pool_key,
+            self._open_scope,
+            check=lambda scope: scope.query("*IDN?"),
+            close=lambda scope: scope.close(),
+        )
+        # tm_devices command objects (scope.commands...) go through these too.
+        profiler.wrap_methods(
+            self.scope, "TekMSO58", {"write": "write", "query": "query", "read_raw": "read"}
+        )
 
         return self.scope.query("*IDN?")
+
+    def _open_scope(self):
+        self.preclean_visa_buffer()
+        return self.dm.add_scope(
+            self.address,
+            alias=self.alias,
+            **TM_DEVICES_CONNECTIONS[self.transport],
+        )
     
     def preclean_visa_buffer(self):
         """
@@ -33,9 +70,13 @@ class TekMSO58:
         clearing any leftover binary output in the Tektronix VISA buffer
         before tm_devices tries to auto-detect the driver.
         """
-        rm = pyvisa.ResourceManager()
+        rm = visa_pool.resource_manager()
         try:
-            inst = rm.open_resource(self.address, timeout=1000)
+            inst = rm.open_resource(
+                resource_string(self.address, self.transport),
+                timeout=1000,
+                **resource_options(self.transport),
+            )
         except Exception:
             return  # If Tek isn't reachable yet, let tm_devices deal with it
 
@@ -59,6 +100,9 @@ class TekMSO58:
             except Exception:
                 pass
 
+    def reset(self):
+        self.scope.reset()
+
     # ------------------------------
     # Basic SCPI passthrough
     # ------------------------------
@@ -167,6 +211,49 @@ class TekMSO58:
         }
 
     # Waveform Acquisition
+    def acquire_single(self, poll_interval=0.1):
+        """
+        Run one single-sequence acquisition and wait for it to finish.
+        """
+        self.write("ACQ:STOPAfter SEQ")
+        self.write("ACQ:STATE ON")
+
+        while int(self.query("ACQ:STATE?")) != 0:
+            time.sleep(poll_interval)
+
+        self.write("ACQ:STATE OFF")
+        time.sleep(0.05)
+
+    def read_curve(self, ch):
+        """
+        Transfer the last acquired record of a channel as 16-bit binary.
+        Returns (t, volts) NumPy arrays.
+        """
+        self.write(f"DATA:SOURCE CH{ch}")
+        self.write("DATA:ENC SRIbinary")
+        self.write("DATA:WIDTH 2")
+
+        ymult = float(self.query("WFMPRE:YMULT?"))
+        yoff  = float(self.query("WFMPRE:YOFF?"))
+        yzero = float(self.query("WFMPRE:YZERO?"))
+        xincr = float(self.query("WFMPRE:XINCR?"))
+
+        self.write("CURVE?")
+        raw = self.scope.read_raw()
+
+        assert raw[0:1] == b"#"
+        ndigits = int(raw[1:2])
+        nbytes  = int(raw[2:2+ndigits])
+        start = 2 + ndigits
+        end   = start + nbytes
+
+        buf = raw[start:end]
+        samples = np.frombuffer(buf, dtype="<i2")
+        volts = (samples - yoff) * ymult + yzero
+        t = np.arange(len(volts)) * xincr
+
+        return t, volts
+
     def capture(self, channels, duration, save_to=None, sample_rate=None, show_plot=False):
         self.scope.commands.acquire.state.write("OFF")
         self.scope.commands.acquire.mode.write("SAMPLE")
@@ -179,51 +266,22 @@ class TekMSO58:
             record_length = int(duration * sample_rate)
             self.write(f"HORIZONTAL:RECORDLENGTH {record_length}")
 
-        datafile = pd.DataFrame()
+        t = None
+        data = {}
 
         for ch in channels:
-            print(f"Acquiring ch {ch}")
-
-            self.write(f"DATA:SOURCE CH{ch}")
-            self.write("DATA:ENC SRIbinary")
-            self.write("DATA:WIDTH 2")
-
-            self.write("ACQ:STOPAfter SEQ")
-            self.write("ACQ:STATE ON")
-
-            while int(self.query("ACQ:STATE?")) != 0:
-                time.sleep(0.1)
-
-            self.write("ACQ:STATE OFF")
-            time.sleep(0.05)
-
-            ymult = float(self.query("WFMPRE:YMULT?"))
-            yoff  = float(self.query("WFMPRE:YOFF?"))
-            yzero = float(self.query("WFMPRE:YZERO?"))
-            xincr = float(self.query("WFMPRE:XINCR?"))
-
-            self.write("CURVE?")
-            raw = self.scope.read_raw()
-
-            assert raw[0:1] == b"#"
-            ndigits = int(raw[1:2])
-            nbytes  = int(raw[2:2+ndigits])
-            start = 2 + ndigits
-            end   = start + nbytes
+            log.info("Acquiring ch %s", ch)
 
-            buf = raw[start:end]
-            samples = np.frombuffer(buf, dtype="<i2")
-            volts = (samples - yoff) * ymult + yzero
-            t = np.arange(len(volts)) * xincr
+            self.acquire_single()
+            t, volts = self.read_curve(ch)
 
-            datafile["t"] = t
-            datafile[f"{ch}"] = volts
-
-        if save_to is not None:
-            datafile.to_csv(save_to)
+            data[f"{ch}"] = volts
 
         if show_plot:
-            plt.plot(datafile["t"], datafile[f"{channels[0]}"])
+            # matplotlib is slow to import and only needed here.
+            import matplotlib.pyplot as plt
+
+            plt.plot(t, data[f"{channels[0]}"])
             plt.show()
 
         # Retrieve configured measurements
@@ -242,17 +300,30 @@ class TekMSO58:
                 pass
 
         # Return structured capture info
-        return {
+        result = {
             "channels": channels,
             "duration": duration,
             "file": save_to,
             "num_channels": len(channels),
             "samples_per_channel": {
-                ch: len(datafile[f"{ch}"]) for ch in channels
+                ch: len(data[f"{ch}"]) for ch in channels
             },
             "measurements": measurements,
         }
 
+        if save_to is not None:
+            save_waveforms(save_to, t, data, metadata=result)
+
+        result["data"] = {"t": t, **data}
+        return result
+
+
+    def frequency_response(self, wavegen, **kwargs):
+        """
+        Gain/phase sweep driving `wavegen` (a RigolDG1062Z).
+        See instruments.frequency_response for the parameters.
+        """
+        return frequency_response(scope=self, wavegen=wavegen, **kwargs)
 
     # Screenshot
     def screenshot(self, save_to="scope.png"):
@@ -276,6 +347,8 @@ class TekMSO58:
     # ------------------------------
     def close(self):
         if self.dm:
-            self.dm.close()
+            # The scope stays connected in the pool; visa_pool.close_all()
+            # closes the DeviceManager at exit.
+            visa_pool.release(self._pool_key)
             self.dm = None
             self.scope = None
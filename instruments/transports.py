@@ -0,0 +1,30 @@
+from instruments.async_scpi import SCPI_SOCKET_PORT
+
+# LAN transports a driver can be asked to use in a routine's
+# instruments block:  transport: vxi11 | socket | hislip
+TRANSPORTS = ("vxi11", "socket", "hislip")
+
+DEFAULT_TRANSPORT = "vxi11"
+
+
+def resource_string(ip, transport=DEFAULT_TRANSPORT, port=SCPI_SOCKET_PORT):
+    """
+    VISA resource string for an instrument at ip over the given transport.
+    """
+    if transport == "vxi11":
+        return f"TCPIP::{ip}::INSTR"
+    if transport == "socket":
+        return f"TCPIP::{ip}::{port}::SOCKET"
+    if transport == "hislip":
+        return f"TCPIP::{ip}::hislip0::INSTR"
+    raise ValueError(f"Unsupported transport: {transport}")
+
+
+def resource_options(transport):
+    """
+    Extra open_resource() settings. Raw sockets have no message framing,
+    so reads and writes need an explicit termination.
+    """
+    if transport == "socket":
+        return {"read_termination": "\n", "write_termination": "\n"}
+    return {}
@@ -0,0 +1,160 @@
+import atexit
+import os
+import threading
+import time
+
+import pyvisa
+
+from instruments.log import get_logger
+
+log = get_logger("visa_pool")
+
+# VISA implementation shared by every driver: "" lets pyvisa pick the
+# installed one, "@py" selects pyvisa-py.
+VISA_LIBRARY = os.environ.get("TESTBENCH_VISA_LIBRARY", "")
+
+# Pooled connections idle for longer than this are checked before reuse.
+HEALTH_CHECK_IDLE = 5.0
+
+_lock = threading.RLock()
+_resource_manager = None
+_device_manager = None
+_pool = {}
+
+
+class _Entry:
+    def __init__(self, conn, check, close):
+        self.conn = conn
+        self.check = check
+        self.close = close
+        self.last_used = time.monotonic()
+        self.users = 0
+
+
+# ----------------------------------------------------------------------
+# Backends
+# ----------------------------------------------------------------------
+
+def resource_manager():
+    """
+    The process-wide pyvisa ResourceManager, created on first use.
+    """
+    global _resource_manager
+    with _lock:
+        if _resource_manager is None:
+            _resource_manager = pyvisa.ResourceManager(VISA_LIBRARY)
+        return _resource_manager
+
+
+def device_manager():
+    """
+    The process-wide tm_devices DeviceManager, created on first use.
+    """
+    global _device_manager
+    with _lock:
+        if _device_manager is None:
+            from tm_devices import DeviceManager
+
+            _device_manager = DeviceManager(verbose=False)
+        return _device_manager
+
+
+# ----------------------------------------------------------------------
+# Connection pool
+# ----------------------------------------------------------------------
+
+def _discard(key):
+    entry = _pool.pop(key, None)
+    if entry is not None and entry.close is not None:
+        try:
+            entry.close(entry.conn)
+        except Exception:
+            pass
+
+
+def acquire(key, open_fn, check=None, close=None):
+    """
+    Return the pooled connection for key, opening it with open_fn() if
+    there is none. A connection idle for more than HEALTH_CHECK_IDLE
+    seconds is checked with check(conn) first and reopened if that fails.
+    close(conn) is used when the connection is finally dropped.
+    """
+    with _lock:
+        entry = _pool.get(key)
+
+        if entry is not None and check is not None:
+            if time.monotonic() - entry.last_used > HEALTH_CHECK_IDLE:
+                try:
+                    check(entry.conn)
+                except Exception as e:
+                    log.warning("[visa_pool] %s: stale connection (%s), reopening", key, e)
+                    _discard(key)
+                    entry = None
+
+        if entry is None:
+            entry = _Entry(open_fn(), check, close)
+            _pool[key] = entry
+
+        entry.users += 1
+        entry.last_used = time.monotonic()
+        return entry.conn
+
+
+def release(key, close=False):
+    """
+    Hand a connection back to the pool. It stays open for reuse unless
+    close is set and nothing else holds it.
+    """
+    with _lock:
+        entry = _pool.get(key)
+        if entry is None:
+            return
+        entry.users = max(0, entry.users - 1)
+        entry.last_used = time.monotonic()
+        if close and entry.users == 0:
+            _discard(key)
+
+
+def _visa_check(session):
+    session.query("*IDN?")
+
+
+def open_session(resource, timeout=None, **options):
+    """
+    Pooled pyvisa session for a resource string, opened on the shared
+    ResourceManager.
+    """
+    session = acquire(
+        resource,
+        lambda: resource_manager().open_resource(resource, **options),
+        check=_visa_check,
+        close=lambda s: s.close(),
+    )
+    if timeout is not None:
+        session.timeout = timeout
+    return session
+
+
+def close_all():
+    """
+    Close every pooled connection and the shared backends.
+    """
+    global _resource_manager, _device_manager
+    with _lock:
+        for key in list(_pool):
+            _discard(key)
+        if _device_manager is not None:
+            try:
+                _device_manager.close()
+            except Exception:
+                pass
+            _device_manager = None
+        if _resource_manager is not None:
+            try:
+                _resource_manager.close()
+            except Exception:
+                pass
+            _resource_manager = None
+
+
+atexit.register(close_all)
@@ -0,0 +1,74 @@
+import json
+import os
+
+import numpy as np
+
+
+def save_waveforms(path, t, channels, metadata=None):
+    """
+    Save a time axis and per-channel sample arrays.
+
+    .npz files store the arrays in binary form, plus the capture
+    metadata as a JSON string under "metadata". Any other extension is
+    written as CSV with an index column, a "t" column and one column per
+    channel, matching the layout of earlier scope captures.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    names = [str(ch) for ch in channels]
+    arrays = [np.asarray(v) for v in channels.values()]
+
+    if path.lower().endswith(".npz"):
+        np.savez(
+            path,
+            t=np.asarray(t),
+            metadata=np.array(json.dumps(metadata or {}, default=str)),
+            **dict(zip(names, arrays)),
+        )
+        return path
+
+    n = min([len(t)] + [len(a) for a in arrays])
+    table = np.column_stack(
+        [np.arange(n), np.asarray(t)[:n]] + [a[:n] for a in arrays]
+    )
+    np.savetxt(
+        path,
+        table,
+        delimiter=",",
+        header=",".join(["", "t"] + names),
+        comments="",
+        fmt=["%d"] + ["%.10g"] * (table.shape[1] - 1),
+    )
+    return path
+
+
+def load_waveforms(path):
+    """
+    Load a file written by save_waveforms.
+
+    Returns (t, channels, metadata) where channels maps column names to
+    NumPy arrays.
+    """
+    if path.lower().endswith(".npz"):
+        with np.load(path) as archive:
+            metadata = json.loads(str(archive["metadata"])) if "metadata" in archive.files else {}
+            channels = {
+                name: archive[name]
+                for name in archive.files
+                if name not in ("t", "metadata")
+            }
+            return archive["t"], channels, metadata
+
+    with open(path) as f:
+        header = f.readline().strip().split(",")
+
+    table = np.loadtxt(path, delimiter=",", skiprows=1, ndmin=2)
+    t_idx = header.index("t")
+    channels = {
+        name: table[:, i]
+        for i, name in enumerate(header)
+        if name not in ("", "t")
+    }
+    return table[:, t_idx], channels, {}
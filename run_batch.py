@@ -0,0 +1,278 @@
+"""
+Run many routines over many DUTs in one process.
+
+    python run_batch.py <manifest>.yaml [--output results] [--pause] [--save_log]
+
+A manifest lists the routines to run for every DUT and, per DUT, the
+environment variables its routines reference:
+
+    name: psu_production
+    routines:
+      - keysight_es36312_test.yaml
+      - keithley_2450_test.yaml
+    duts:
+      - DUT_SERIAL: SN0001
+        VOUT: 3.3
+      - DUT_SERIAL: SN0002
+        VOUT: 5.0
+
+Every routine is validated for every DUT before any hardware is touched,
+instruments are connected once for the whole batch, and all results go to
+one JSON file.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import yaml
+
+from run_test import (
+    BASE_DIR,
+    YAML_LOADER,
+    Tee,
+    init_instruments,
+    load_env_file,
+    load_routine,
+    resolve_yaml_path,
+)
+from instruments.instrument_registry import INSTRUMENT_CLASSES
+from instruments.log import LOG_LEVELS, AsyncFileWriter, setup_logging
+from instruments.results_store import RunRecorder, save_run, to_json
+from instruments.routine_compiler import RoutineError, compile_routine
+from instruments.routine_runner import run_plan
+
+RESULTS_DIR = os.path.join(BASE_DIR, "results")
+
+# Fields of each run record step (already summarized, see
+# results_store.summarize) copied into the batch file.
+BATCH_STEP_FIELDS = ("index", "id", "action", "instrument", "loop", "status", "result", "artifacts")
+
+
+# ----------------------------------------------------------------------
+# Manifest
+# ----------------------------------------------------------------------
+
+def load_manifest(path):
+    with open(path, "r") as f:
+        manifest = yaml.load(f, Loader=YAML_LOADER)
+
+    if not isinstance(manifest, dict):
+        raise ValueError(f"{path}: manifest must be a mapping")
+
+    routines = manifest.get("routines")
+    if not isinstance(routines, list) or not routines:
+        raise ValueError(f"{path}: 'routines' must be a non-empty list")
+
+    duts = manifest.get("duts")
+    if not isinstance(duts, list) or not duts:
+        raise ValueError(f"{path}: 'duts' must be a non-empty list")
+    for i, dut in enumerate(duts):
+        if not isinstance(dut, dict):
+            raise ValueError(f"{path}: duts[{i}] must be a mapping of variables")
+
+    manifest.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+    return manifest
+
+
+def dut_env(dut):
+    """
+    The environment a DUT's routines are substituted with: os.environ
+    overlaid with the DUT's variables. os.environ itself is left alone,
+    so a variable one DUT sets is never seen by the next.
+    """
+    env = dict(os.environ)
+    env.update((str(var), str(value)) for var, value in dut.items())
+    return env
+
+
+def compile_batch(manifest):
+    """
+    Load and compile every routine for every DUT.
+
+    Returns (runs, instruments_cfg): runs is a list of
+    (dut_index, routine, plan), instruments_cfg the union of the routines'
+    instrument blocks.
+    """
+    runs = []
+    instruments_cfg = {}
+    errors = []
+
+    for i, dut in enumerate(manifest["duts"]):
+        env = dut_env(dut)
+
+        for routine in manifest["routines"]:
+            config_path = resolve_yaml_path(routine)
+            try:
+                cfg, key = load_routine(config_path, env)
+                plan = compile_routine(
+                    cfg, known_instruments=INSTRUMENT_CLASSES, source_key=key
+                )
+            except (yaml.YAMLError, RoutineError) as e:
+                errors.append(f"DUT {i} / {routine}:\n{e}")
+                continue
+
+            for name, info in (cfg.get("instruments") or {}).items():
+                known = instruments_cfg.setdefault(name, info)
+                if (known.get("ip"), known.get("transport")) != (info.get("ip"), info.get("transport")):
+                    errors.append(
+                        f"DUT {i} / {routine}: instrument '{name}' at {info.get('ip')} "
+                        f"conflicts with {known.get('ip')} used elsewhere in the batch"
+                    )
+
+            runs.append((i, routine, plan))
+
+    if errors:
+        raise RoutineError(errors)
+
+    return runs, instruments_cfg
+
+
+# ----------------------------------------------------------------------
+# Execution
+# ----------------------------------------------------------------------
+
+def run_batch(manifest, output_dir=RESULTS_DIR, pause=False):
+    """
+    Run every routine for every DUT on one set of connected instruments.
+    A failing routine is recorded and the DUT's remaining routines are
+    skipped; the batch continues with the next DUT.
+
+    Returns the path of the result file.
+    """
+    print(f"Batch: {manifest['name']}")
+    print(f"Start time: {datetime.now().isoformat()}")
+
+    runs, instruments_cfg = compile_batch(manifest)
+    duts = manifest["duts"]
+    print(f"[batch] {len(duts)} DUT(s) x {len(manifest['routines'])} routine(s) validated")
+
+    t0 = time.perf_counter()
+    instruments = init_instruments({"instruments": instruments_cfg})
+    records = []
+
+    try:
+        for i, dut in enumerate(duts):
+            if pause:
+                input(f"\n[batch] Insert DUT {i} {dut} and press Enter...")
+            print(f"\n=== DUT {i}: {dut} ===")
+
+            failed = False
+            for index, routine, plan in runs:
+                if index != i:
+                    continue
+
+                record = {"dut": i, "params": dut, "routine": routine}
+                if failed:
+                    record["status"] = "skipped"
+                    records.append(record)
+                    continue
+
+                print(f"\n--- {routine} ---")
+                start = time.perf_counter()
+                recorder = RunRecorder(routine, plan.key)
+                record["run_id"] = recorder.run_id
+                try:
+                    run_plan(plan, instruments, recorder)
+                    record["status"] = "passed"
+                    run = recorder.finish()
+                except Exception as e:
+                    print(f"ERROR: {routine} failed for DUT {i}: {e}")
+                    record["status"] = "failed"
+                    record["error"] = f"{type(e).__name__}: {e}"
+                    run = recorder.finish(e)
+                    failed = True
+                save_run(run)
+                record["steps"] = [
+                    {field: step[field] for field in BATCH_STEP_FIELDS} for step in run["steps"]
+                ]
+                record["artifacts"] = run["artifacts"]
+                record["duration_s"] = time.perf_counter() - start
+                records.append(record)
+    finally:
+        for inst in instruments.values():
+            inst.close()
+
+    elapsed = time.perf_counter() - t0
+    duts_per_hour = len(duts) / elapsed * 3600 if elapsed > 0 else 0.0
+    failed_duts = sorted({r["dut"] for r in records if r["status"] == "failed"})
+
+    os.makedirs(output_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    out_path = os.path.join(output_dir, f"batch-{timestamp}-{manifest['name']}.json")
+    with open(out_path, "w") as f:
+        json.dump(
+            {
+                "batch": manifest["name"],
+                "routines": manifest["routines"],
+                "duts": len(duts),
+                "failed_duts": failed_duts,
+                "duration_s": elapsed,
+                "duts_per_hour": duts_per_hour,
+                "runs": records,
+            },
+            f,
+            indent=2,
+            default=to_json,
+        )
+
+    print("\n=== Batch complete ===")
+    print(f"End time: {datetime.now().isoformat()}")
+    print(
+        f"[batch] {len(duts)} DUT(s) in {elapsed:.1f} s "
+        f"({duts_per_hour:.1f} DUTs/hour), {len(failed_duts)} failed"
+    )
+    print(f"[batch] Results saved to {out_path}")
+    return out_path
+
+
+# ----------------------------------------------------------------------
+# CLI
+# ----------------------------------------------------------------------
+
+def main():
+    load_env_file()
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("manifest", help="Batch manifest YAML file")
+    parser.add_argument("--output", default=RESULTS_DIR, help="Directory for the result file")
+    parser.add_argument("--pause", action="store_true", help="Wait for Enter before each DUT")
+    parser.add_argument("--save_log", action="store_true", help="Save console output to a log file")
+    parser.add_argument("--log_level", choices=LOG_LEVELS, default="INFO")
+    args = parser.parse_args()
+    setup_logging(args.log_level)
+
+    try:
+        manifest = load_manifest(args.manifest)
+    except (OSError, yaml.YAMLError, ValueError) as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+
+    try:
+        if not args.save_log:
+            run_batch(manifest, args.output, args.pause)
+            return
+
+        os.makedirs("testbench_logs", exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        log_path = os.path.join("testbench_logs", f"{timestamp}-batch-{manifest['name']}.log")
+
+        log_file = AsyncFileWriter(log_path)
+        original_stdout = sys.stdout
+        sys.stdout = Tee(sys.stdout, log_file)
+        try:
+            print(f"[LOG] Saving output to {log_path}")
+            run_batch(manifest, args.output, args.pause)
+        finally:
+            sys.stdout = original_stdout
+            log_file.close()
+        print(f"[LOG] Batch log saved to {log_path}")
+    except RoutineError as e:
+        print(f"ERROR: Batch failed validation:\n{e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
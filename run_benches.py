@@ -0,0 +1,258 @@
+"""
+Run one routine on several identical benches at once.
+
+    python run_benches.py <routine>.yaml --benches benches/bench1.env benches/bench2.env [--async]
+
+Each bench is described by an env file with its instrument addresses
+(the same variables as .env, which it overrides). Every bench runs in its
+own worker process; their output is streamed back prefixed with the bench
+name, and the results and logs of all benches are merged into one file each.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from datetime import datetime
+
+from instruments.log import LOG_LEVELS, setup_logging
+from instruments.results_store import summarize, to_json
+from run_batch import RESULTS_DIR
+from run_test import load_env_file, resolve_yaml_path, run_test
+
+LOG_DIR = "testbench_logs"
+
+
+# ----------------------------------------------------------------------
+# Worker
+# ----------------------------------------------------------------------
+
+class _QueueStream:
+    """
+    File-like object that forwards printed output to the scheduler line
+    by line.
+    """
+
+    def __init__(self, progress, bench):
+        self.progress = progress
+        self.bench = bench
+        self.buffer = ""
+
+    def write(self, data):
+        self.buffer += data
+        if "\n" in self.buffer:
+            head, _, self.buffer = self.buffer.rpartition("\n")
+            for line in head.split("\n"):
+                self.progress.put((self.bench, "out", line))
+
+    def flush(self):
+        if self.buffer:
+            self.progress.put((self.bench, "out", self.buffer))
+            self.buffer = ""
+
+
+def _files_under(directory):
+    return sorted(
+        os.path.join(root, name)
+        for root, _, names in os.walk(directory)
+        for name in names
+    )
+
+
+def bench_worker(bench, env_path, yaml_name, use_async, progress, log_level="INFO", output_dir=None):
+    """
+    Process entry point: run the routine with the bench's environment and
+    report ("done", outcome) on the progress queue. Relative save_to paths
+    of the routine are written under output_dir, so benches never
+    overwrite each other's files.
+    """
+    sys.stdout = sys.stderr = _QueueStream(progress, bench)
+    setup_logging(log_level)
+    outcome = {"env": env_path, "status": "passed", "output_dir": output_dir}
+    start = time.perf_counter()
+
+    try:
+        load_env_file()
+        load_env_file(env_path)
+        if output_dir is not None:
+            os.makedirs(output_dir, exist_ok=True)
+        results = run_test(yaml_name, use_async=use_async, output_dir=output_dir)
+        # Summarized plain JSON types: small, and they survive the trip back.
+        outcome["results"] = json.loads(json.dumps(summarize(results), default=to_json))
+    except SystemExit as e:
+        outcome["status"] = "failed"
+        outcome["error"] = f"exited with status {e.code}"
+    except Exception as e:
+        print(f"ERROR: {type(e).__name__}: {e}")
+        outcome["status"] = "failed"
+        outcome["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        sys.stdout.flush()
+
+    if output_dir is not None:
+        outcome["artifacts"] = _files_under(output_dir)
+    outcome["duration_s"] = time.perf_counter() - start
+    progress.put((bench, "done", outcome))
+
+
+# ----------------------------------------------------------------------
+# Scheduler
+# ----------------------------------------------------------------------
+
+def bench_names(env_paths):
+    """
+    Short unique name per env file: benches/bench1.env -> bench1,
+    benches/bench1/.env -> bench1.
+    """
+    names = {}
+    for path in env_paths:
+        name = os.path.basename(path)
+        if name.endswith(".env"):
+            name = name[: -len(".env")]
+        if not name:
+            name = os.path.basename(os.path.dirname(os.path.abspath(path)))
+
+        unique, n = name, 2
+        while unique in names:
+            unique, n = f"{name}-{n}", n + 1
+        names[unique] = path
+    return names
+
+
+def run_benches(yaml_name, env_paths, use_async=False, output_dir=RESULTS_DIR, log_level="INFO"):
+    """
+    Run yaml_name on every bench in parallel and merge their results and
+    logs. Returns the names of the benches that failed.
+    """
+    resolve_yaml_path(yaml_name)
+    for path in env_paths:
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"Bench env file not found: {path}")
+
+    benches = bench_names(env_paths)
+    routine = os.path.splitext(yaml_name)[0]
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+
+    os.makedirs(LOG_DIR, exist_ok=True)
+    log_path = os.path.join(LOG_DIR, f"{timestamp}-{routine}-benches.log")
+    files_dir = os.path.join(output_dir, f"benches-{timestamp}-{routine}")
+
+    # Spawned workers start clean: no VISA sessions or event loops are
+    # inherited from this process.
+    ctx = multiprocessing.get_context("spawn")
+    progress = ctx.Queue()
+    workers = {
+        bench: ctx.Process(
+            target=bench_worker,
+            args=(
+                bench, path, yaml_name, use_async, progress, log_level,
+                os.path.join(files_dir, bench),
+            ),
+            name=f"bench-{bench}",
+        )
+        for bench, path in benches.items()
+    }
+
+    print(f"[benches] {routine} on {len(workers)} bench(es): {', '.join(workers)}")
+    t0 = time.perf_counter()
+    outcomes = {}
+    # Benches seen dead on the previous empty poll. A worker's last
+    # messages can still be in the queue right after it exits, so it only
+    # counts as died if another poll comes back empty.
+    exited = set()
+
+    with open(log_path, "w") as log_file:
+        for worker in workers.values():
+            worker.start()
+
+        try:
+            while len(outcomes) < len(workers):
+                try:
+                    bench, kind, payload = progress.get(timeout=1.0)
+                except queue.Empty:
+                    for bench, worker in workers.items():
+                        if bench in outcomes or worker.is_alive():
+                            continue
+                        if bench not in exited:
+                            exited.add(bench)
+                        else:
+                            outcomes[bench] = {
+                                "env": benches[bench],
+                                "status": "failed",
+                                "error": f"worker died with exit code {worker.exitcode}",
+                                "output_dir": os.path.join(files_dir, bench),
+                            }
+                    continue
+
+                if kind == "out":
+                    line = f"[{bench}] {payload}"
+                    print(line)
+                    log_file.write(line + "\n")
+                elif kind == "done":
+                    outcomes[bench] = payload
+                    print(f"[benches] {bench}: {payload['status']} ({payload['duration_s']:.1f} s)")
+        except KeyboardInterrupt:
+            print("[benches] Interrupted, stopping workers")
+            for worker in workers.values():
+                worker.terminate()
+            raise
+        finally:
+            for worker in workers.values():
+                worker.join()
+
+    elapsed = time.perf_counter() - t0
+    failed = sorted(b for b, o in outcomes.items() if o["status"] != "passed")
+
+    os.makedirs(output_dir, exist_ok=True)
+    out_path = os.path.join(output_dir, f"benches-{timestamp}-{routine}.json")
+    with open(out_path, "w") as f:
+        json.dump(
+            {
+                "routine": yaml_name,
+                "duration_s": elapsed,
+                "failed": failed,
+                "benches": {bench: outcomes[bench] for bench in benches},
+            },
+            f,
+            indent=2,
+            default=to_json,
+        )
+
+    print("\n=== Benches complete ===")
+    print(f"[benches] {len(benches)} bench(es) in {elapsed:.1f} s, {len(failed)} failed")
+    print(f"[benches] Results saved to {out_path}")
+    print(f"[LOG] Merged log saved to {log_path}")
+    return failed
+
+
+# ----------------------------------------------------------------------
+# CLI
+# ----------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("yaml_file", help="YAML test file (looked up in routines/)")
+    parser.add_argument("--benches", nargs="+", required=True, metavar="ENV_FILE",
+                        help="One env file per bench")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Run each bench on an asyncio event loop")
+    parser.add_argument("--output", default=RESULTS_DIR, help="Directory for the result file")
+    parser.add_argument("--log_level", choices=LOG_LEVELS, default="INFO")
+    args = parser.parse_args()
+
+    try:
+        failed = run_benches(
+            args.yaml_file, args.benches, args.use_async, args.output, args.log_level
+        )
+    except FileNotFoundError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,17 @@
 import argparse
+import asyncio
 import sys
 import yaml
 import os
 import re
 from datetime import datetime
 
+from instruments import cache, profiler
+from instruments.log import LOG_LEVELS, AsyncFileWriter, setup_logging
+from instruments.results_store import RunRecorder, save_run
 from instruments.instrument_registry import INSTRUMENT_CLASSES
-from instruments.step_dispatcher import execute_step
+from instruments.routine_compiler import PATH_PARAMS, RoutineError, compile_routine, rebase_paths
+from instruments.routine_runner import run_plan, run_plan_async
 
 
 # ─────────────────────────────────────────────────────────────
@@ -20,19 +25,25 @@ DOCS_DIR = os.path.join(BASE_DIR, "docs")
 INSTRUMENT_DOCS_DIR = os.path.join(DOCS_DIR, "instruments")
 REFERENCE_DOC = os.path.join(BASE_DIR, "README.md")
 
+ENV_VAR_PATTERN = re.compile(r'\$\{([^}]+)\}')
+
+# C-accelerated loader when PyYAML was built with libyaml.
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 
 # ─────────────────────────────────────────────────────────────
 # Utilities
 # ─────────────────────────────────────────────────────────────
 
 class Tee:
+    # Streams are flushed on flush() only (the console is line-buffered
+    # anyway), not on every write.
     def __init__(self, *streams):
         self.streams = streams
 
     def write(self, data):
         for s in self.streams:
             s.write(data)
-            s.flush()
 
     def flush(self):
         for s in self.streams:
@@ -67,9 +78,9 @@ def extract_section(content, section_title):
     return '\n'.join(section_lines)
 
 
-def load_env_file():
-    """Load environment variables from .env file if it exists."""
-    env_path = os.path.join(BASE_DIR, ".env")
+def load_env_file(env_path=None):
+    """Load environment variables from .env (or env_path) if it exists."""
+    env_path = env_path or os.path.join(BASE_DIR, ".env")
     if os.path.isfile(env_path):
         with open(env_path, "r") as f:
             for line in f:
@@ -80,25 +91,30 @@ def load_env_file():
                         os.environ[key.strip()] = value.strip()
 
 
-def substitute_env_vars(content):
-    """Substitute ${VAR_NAME} with environment variable values."""
+def substitute_env_vars(content, env=None):
+    """
+    Substitute ${VAR_NAME} with values from env (default os.environ).
+    Raises RoutineError listing every missing variable.
+    """
+    if env is None:
+        env = os.environ
     missing_vars = []
     def replace_var(match):
         var_name = match.group(1)
-        value = os.environ.get(var_name)
+        value = env.get(var_name)
         if value is None:
             missing_vars.append(var_name)
             return match.group(0)  # Keep unsubstituted for now
         return value
     
     # Replace ${VAR_NAME} patterns
-    pattern = re.compile(r'\$\{([^}]+)\}')
-    result = pattern.sub(replace_var, content)
+    result = ENV_VAR_PATTERN.sub(replace_var, content)
     
     if missing_vars:
-        print(f"ERROR: Missing environment variables: {', '.join(set(missing_vars))}")
-        print("Please set these variables or add them to your .env file.")
-        sys.exit(1)
+        raise RoutineError([
+            f"Missing environment variables: {', '.join(sorted(set(missing_vars)))}. "
+            "Please set these variables or add them to your .env file."
+        ])
     
     return result
 
@@ -152,51 +168,210 @@ def resolve_yaml_path(yaml_name: str) -> str:
     return path
 
 
+def create_instrument(name, info):
+    cls = INSTRUMENT_CLASSES[name]
+    if "transport" in info:
+        return cls(info["ip"], transport=info["transport"])
+    return cls(info["ip"])
+
+
 def init_instruments(cfg):
     instruments = {}
     for name, info in cfg["instruments"].items():
         if name == "local":
             continue
-        cls = INSTRUMENT_CLASSES[name]
-        inst = cls(info["ip"])
+        inst = create_instrument(name, info)
         idn = inst.connect()
         print(f"[IDN] {name}: {idn}")
         instruments[name] = inst
     return instruments
 
 
-def run_test(yaml_name):
+async def init_instruments_async(cfg):
+    """
+    Connect all instruments concurrently. Instrument-based drivers get a
+    raw-socket asyncio session unless the routine sets another transport
+    for them; the others connect in worker threads.
+    """
+    from instruments.instrument_base import Instrument
+
+    instruments = {}
+    for name, info in cfg["instruments"].items():
+        if name == "local":
+            continue
+        instruments[name] = create_instrument(name, info)
+
+    async def connect(inst, info):
+        if isinstance(inst, Instrument):
+            return await inst.aconnect(transport=info.get("transport", "socket"))
+        return await asyncio.to_thread(inst.connect)
+
+    idns = await asyncio.gather(
+        *(connect(inst, cfg["instruments"][name]) for name, inst in instruments.items())
+    )
+    for name, idn in zip(instruments, idns):
+        print(f"[IDN] {name}: {idn}")
+    return instruments
+
+
+async def close_instruments_async(instruments):
+    from instruments.instrument_base import Instrument
+
+    for inst in instruments.values():
+        if isinstance(inst, Instrument):
+            await inst.aclose()
+        else:
+            await asyncio.to_thread(inst.close)
+
+
+async def run_plan_on_loop(plan, cfg, recorder=None):
+    instruments = await init_instruments_async(cfg)
+    try:
+        print("\n=== Starting test sequence (asyncio) ===")
+        return await run_plan_async(plan, instruments, recorder)
+    finally:
+        await close_instruments_async(instruments)
+
+
+def routine_key(content, env=None):
+    """
+    Cache key for a routine: its raw text plus the current values of the
+    environment variables it references.
+    """
+    if env is None:
+        env = os.environ
+    names = sorted(set(ENV_VAR_PATTERN.findall(content)))
+    return cache.content_key(
+        content,
+        *(f"{name}={env.get(name)}" for name in names),
+    )
+
+
+def load_routine(config_path, env=None):
+    """
+    Read, substitute and parse a routine. Parsed routines are cached by
+    routine_key, so relaunching an unchanged routine skips YAML parsing.
+    env overrides os.environ for the substitution.
+
+    Returns (cfg, key).
+    """
+    with open(config_path, "r") as f:
+        content = f.read()
+
+    key = routine_key(content, env)
+    cfg = cache.load("routines", key)
+    if cfg is not None:
+        return cfg, key
+
+    # Substitute environment variables
+    content = substitute_env_vars(content, env)
+    cfg = yaml.load(content, Loader=YAML_LOADER)
+    cache.store("routines", key, cfg)
+    return cfg, key
+
+
+def run_on_daemon(yaml_name, cfg, plan, parquet=False):
+    """
+    Send a compiled routine to the bench server and stream its output.
+    Relative paths in the plan were checked against this process's working
+    directory, so they are made absolute before the server, which runs in
+    its own directory, sees them.
+    """
+    from bench_server import connect_client
+
+    plan = rebase_paths(plan, os.getcwd(), PATH_PARAMS)
+
+    try:
+        conn = connect_client()
+    except (ConnectionRefusedError, FileNotFoundError):
+        print("ERROR: No bench server is running. Start one with: python bench_server.py")
+        sys.exit(1)
+
+    with conn:
+        conn.send({
+            "cmd": "run",
+            "name": yaml_name,
+            "cfg": {"instruments": cfg.get("instruments") or {}},
+            "plan": plan,
+            "parquet": parquet,
+        })
+        while True:
+            kind, payload = conn.recv()
+            if kind == "out":
+                sys.stdout.write(payload)
+            elif kind == "done":
+                break
+
+    if payload:
+        print(f"ERROR: Routine failed on the bench server:\n{payload}")
+        sys.exit(1)
+
+
+def run_test(yaml_name, use_async=False, use_daemon=False, parquet=False, output_dir=None):
+    """
+    Load, validate and run a routine. Returns the results table (step id
+    -> result), or None when the routine ran on the bench server.
+
+    With output_dir, relative save_to paths are placed under it instead
+    of the working directory.
+
+    A record of the run (every step with its parameters, result, timing
+    and saved files) is appended to results/runs/runs.jsonl, and to the
+    Parquet dataset in results/runs/steps/ when parquet is set.
+    """
     config_path = resolve_yaml_path(yaml_name)
 
     print(f"Test file: {config_path}")
     print(f"Start time: {datetime.now().isoformat()}")
 
     try:
-        with open(config_path, "r") as f:
-            yaml_content = f.read()
-        # Substitute environment variables
-        yaml_content = substitute_env_vars(yaml_content)
-        cfg = yaml.safe_load(yaml_content)
+        cfg, key = load_routine(config_path)
     except yaml.YAMLError as e:
         print(f"ERROR: Invalid YAML in {config_path}:\n{e}")
         sys.exit(1)
+    except RoutineError as e:
+        print(f"ERROR: {config_path}:\n{e}")
+        sys.exit(1)
 
-    instruments = init_instruments(cfg)
-
-    print("\n=== Starting test sequence ===")
-    last_result = None
+    # Validate the whole routine before touching any hardware.
+    try:
+        plan = compile_routine(
+            cfg, known_instruments=INSTRUMENT_CLASSES, source_key=key
+        )
+    except RoutineError as e:
+        print(f"ERROR: {config_path} failed validation:\n{e}")
+        sys.exit(1)
 
-    for i, step in enumerate(cfg["sequence"], start=1):
+    if output_dir is not None:
+        plan = rebase_paths(plan, output_dir)
+
+    if use_daemon:
+        # Instruments stay connected in the bench server between runs,
+        # and the server stores the run record.
+        if use_async:
+            # The server runs routines on its own thread-based runner.
+            print("[DAEMON] --async is ignored with --daemon")
+        run_on_daemon(yaml_name, cfg, plan, parquet)
+        instruments = {}
+        results = None
+    else:
+        recorder = RunRecorder(yaml_name, plan.key)
+        instruments = {}
         try:
-            inst = instruments[step["instrument"]]
-            print(f"\nStep {i}: {step['action']} on {step['instrument']}")
-        except:
-            inst= None
-        result = execute_step(step, inst, last_result)
-        last_result = result
+            if use_async:
+                # Instruments are connected and closed inside the event loop.
+                results = asyncio.run(run_plan_on_loop(plan, cfg, recorder))
+            else:
+                instruments = init_instruments(cfg)
+
+                print("\n=== Starting test sequence ===")
+                results = run_plan(plan, instruments, recorder)
+        except Exception as e:
+            save_run(recorder.finish(e), parquet)
+            raise
 
-        if result is not None:
-            print(f"  Result: {result}")
+        paths = save_run(recorder.finish(), parquet)
+        print(f"[results] Run {recorder.run_id} saved to {', '.join(paths)}")
 
     print("\n=== Test complete ===")
     print(f"End time: {datetime.now().isoformat()}")
@@ -204,6 +379,8 @@ def run_test(yaml_name):
     for inst in instruments.values():
         inst.close()
 
+    return results
+
 
 # ─────────────────────────────────────────────────────────────
 # CLI
@@ -230,6 +407,38 @@ def main():
         help="Save console output to a log file"
     )
 
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="Drive all instruments from one asyncio event loop over raw SCPI sockets"
+    )
+
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Run on the bench server (bench_server.py), reusing its connected instruments"
+    )
+
+    parser.add_argument(
+        "--parquet",
+        action="store_true",
+        help="Also add the run record to the Parquet dataset in results/runs/steps/ (needs pyarrow)"
+    )
+
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Time every step and instrument command; writes a latency report next to the log"
+    )
+
+    parser.add_argument(
+        "--log_level",
+        choices=LOG_LEVELS,
+        default="INFO",
+        help="Console/log verbosity (DEBUG shows every step's input)"
+    )
+
     parser.add_argument(
         "--help",
         nargs="?",
@@ -239,6 +448,7 @@ def main():
     )
 
     args = parser.parse_args()
+    setup_logging(args.log_level)
 
     if args.help is not None:
         print_help(None if args.help is True else args.help)
@@ -248,31 +458,59 @@ def main():
         print_help()
         return
 
-    if args.save_log:
-        os.makedirs("testbench_logs", exist_ok=True)
+    yaml_name = os.path.splitext(args.yaml_file)[0]
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    log_base = os.path.join("testbench_logs", f"{timestamp}-{yaml_name}")
 
-        yaml_name = os.path.splitext(args.yaml_file)[0]
-        timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
-        log_path = os.path.join("testbench_logs", f"{timestamp}-{yaml_name}.log")
+    if args.profile and args.daemon:
+        # The steps run in the bench server process; nothing to time here.
+        print("[PROFILE] --profile is ignored with --daemon")
+    elif args.profile:
+        profiler.enable()
 
-        with open(log_path, "w") as log_file:
-            original_stdout = sys.stdout
-            original_stderr = sys.stderr
+    try:
+        run_logged(args, log_base)
+    finally:
+        prof = profiler.disable()
+        if prof is not None:
+            os.makedirs("testbench_logs", exist_ok=True)
+            print(f"[PROFILE] Latency report saved to {prof.write_report(log_base + '.profile.txt')}")
 
-            sys.stdout = Tee(sys.stdout, log_file)
-            sys.stderr = Tee(sys.stderr, log_file)
 
-            try:
-                print(f"[LOG] Saving output to {log_path}")
-                run_test(args.yaml_file)
-            finally:
-                sys.stdout = original_stdout
-                sys.stderr = original_stderr
+def run_logged(args, log_base):
+    """
+    run_test with the CLI options, teeing the output to log_base.log when
+    --save_log is set.
+    """
+    if not args.save_log:
+        run_test(
+            args.yaml_file, use_async=args.use_async, use_daemon=args.daemon, parquet=args.parquet
+        )
+        return
 
-        print(f"[LOG] Test log saved to {log_path}")
-    else:
-        run_test(args.yaml_file)
+    os.makedirs("testbench_logs", exist_ok=True)
+    log_path = log_base + ".log"
+
+    # The file is written by a background thread, so logging never
+    # waits on the disk.
+    log_file = AsyncFileWriter(log_path)
+    original_stdout = sys.stdout
+    original_stderr = sys.stderr
 
+    sys.stdout = Tee(sys.stdout, log_file)
+    sys.stderr = Tee(sys.stderr, log_file)
+
+    try:
+        print(f"[LOG] Saving output to {log_path}")
+        run_test(
+            args.yaml_file, use_async=args.use_async, use_daemon=args.daemon, parquet=args.parquet
+        )
+    finally:
+        sys.stdout = original_stdout
+        sys.stderr = original_stderr
+        log_file.close()
+
+    print(f"[LOG] Test log saved to {log_path}")
 
 if __name__ == "__main__":
     main()
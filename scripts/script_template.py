@@ -1,11 +1,18 @@
-#retrieve input data (provided automatically by step dispatcher)
-data = input_data
+# Loaded once (and again only if this file changes), so imports and
+# constants up here are not repeated for every call, e.g. when the
+# script runs inside a loop.
 
-# actions with input_data here:----
 
+def run(input_data, steps):
+    # input_data: result of the previous step (provided by the step dispatcher)
+    # steps: results of earlier steps with an id, e.g. steps["capture"]["file"]
+    data = input_data
 
-#----------------------------------
-# output data here
-OUTPUT = {
+    # actions with input_data here:----
 
-}
\ No newline at end of file
+
+    #----------------------------------
+    # output data here
+    return {
+
+    }